@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdminConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin'
+
+    def ready(self) -> None:
+        from .signals import handlers
@@ -0,0 +1,112 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import transaction
+
+from .serializers import GroupListRetrieveSerializer, PermissionSerializer
+
+
+PERMISSIONS = 'permissions'
+GROUPS = 'groups'
+
+
+def generation_key(name):
+    return f'admin:rbac:{name}:generation'
+
+
+def snapshot_key(name, generation):
+    return f'admin:rbac:{name}:{generation}'
+
+
+def get_timeout():
+    return getattr(settings, 'ADMIN_RBAC_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def get_generation_timeout():
+    # invalidations only reach other processes through a shared cache, with
+    # a process-local one this bounds how long they serve a stale snapshot
+    return getattr(settings, 'ADMIN_RBAC_GENERATION_TIMEOUT', 60)
+
+
+def serialize_group(group):
+    return GroupListRetrieveSerializer(group).data
+
+
+def build_permissions():
+    return list(PermissionSerializer(Permission.objects.order_by('id'), many=True).data)
+
+
+def build_groups():
+    groups = Group.objects.prefetch_related('permissions').order_by('id')
+    return {group.id: serialize_group(group) for group in groups}
+
+
+BUILDERS = {
+    PERMISSIONS: build_permissions,
+    GROUPS: build_groups,
+}
+
+
+def get_generation(name):
+    key = generation_key(name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, timeout=get_generation_timeout())
+        generation = cache.get(key)
+    return generation
+
+
+def get_snapshot(name):
+    """
+    Returns (version, snapshot). The version changes with every change of the
+    snapshot and doubles as its ETag. Snapshots are stored per version, so a
+    snapshot built from data that changed meanwhile is never served under
+    the new version.
+    """
+    generation = get_generation(name)
+    key = snapshot_key(name, generation)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = BUILDERS[name]()
+        cache.set(key, snapshot, timeout=get_timeout())
+    return generation, snapshot
+
+
+def invalidate(name):
+    transaction.on_commit(lambda: cache.set(generation_key(name), uuid4().hex, timeout=get_generation_timeout()))
+
+
+def update_groups(group_ids):
+    """
+    Re-serializes only the given groups into a new version of the groups
+    snapshot, once the transaction is committed.
+    """
+    group_ids = set(group_ids)
+    if group_ids:
+        transaction.on_commit(lambda: _update_groups(group_ids))
+
+
+def _update_groups(group_ids):
+    key = generation_key(GROUPS)
+    generation = cache.get(key)
+    snapshot = cache.get(snapshot_key(GROUPS, generation)) if generation else None
+    new_generation = uuid4().hex
+
+    if snapshot is not None:
+        groups = dict(snapshot)
+        for group_id in group_ids:
+            groups.pop(group_id, None)
+        changed_groups = Group.objects.prefetch_related('permissions').filter(id__in=group_ids)
+        groups.update((group.id, serialize_group(group)) for group in changed_groups)
+        cache.set(
+            snapshot_key(GROUPS, new_generation),
+            dict(sorted(groups.items())),
+            timeout=get_timeout(),
+        )
+
+    if cache.get(key) != generation:
+        # patched concurrently, start over from the database instead
+        new_generation = uuid4().hex
+    cache.set(key, new_generation, timeout=get_generation_timeout())
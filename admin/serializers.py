@@ -1,6 +1,19 @@
 from django.contrib.auth.models import Group, Permission
+from django.db import transaction
 from rest_framework import serializers
 
+from core.authentication import memberships_changed
+from core.constants import Messages
+from core.models import User
+from core.utils import get_missing_ids
+
+
+def validate_ids(queryset, ids):
+    missing_ids = get_missing_ids(queryset, ids)
+    if missing_ids:
+        raise serializers.ValidationError(Messages.INVALID_IDS_ERROR.format(ids=missing_ids))
+    return ids
+
 
 class PermissionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,18 +44,16 @@ class GroupCreateUpdateSerializer(serializers.ModelSerializer):
         model = Group
         fields = ('name', 'permissions', )
 
+    def validate_permissions(self, value):
+        return validate_ids(Permission.objects.all(), [permission['id'] for permission in value])
+
     def create(self, validated_data):
-        permissions_data = validated_data.pop('permissions', [])
+        permission_ids = validated_data.pop('permissions', [])
 
         group = Group(**validated_data)
         group.save()
 
-        permissions = [
-            Permission.objects.get(
-                id=permission['id'],
-            ) for permission in permissions_data
-        ]
-        group.permissions.set(permissions)
+        group.permissions.set(permission_ids)
         return group
 
 
@@ -50,14 +61,57 @@ class GroupCreateUpdateSerializer(serializers.ModelSerializer):
         instance.name = validated_data.get('name', instance.name)
         instance.save()
 
-        permissions_data = validated_data.get('permissions')
+        permission_ids = validated_data.get('permissions')
 
-        if permissions_data != None:
-            permissions = [
-                Permission.objects.get(
-                    id=permission['id'],
-                ) for permission in permissions_data
-        ]
-            instance.permissions.set(permissions)
+        if permission_ids != None:
+            instance.permissions.set(permission_ids)
         
         return instance
+
+
+class GroupMembershipSerializer(serializers.Serializer):
+    ACTION_ADD = 'add'
+    ACTION_REMOVE = 'remove'
+
+    action = serializers.ChoiceField(choices=[ACTION_ADD, ACTION_REMOVE])
+    users = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    groups = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate_users(self, value):
+        return validate_ids(User.objects.all(), list(set(value)))
+
+    def validate_groups(self, value):
+        return validate_ids(Group.objects.all(), list(set(value)))
+
+    def save(self):
+        user_ids = self.validated_data['users']
+        group_ids = self.validated_data['groups']
+        Membership = User.groups.through
+        memberships = Membership.objects.filter(user_id__in=user_ids, group_id__in=group_ids)
+
+        # set-based writes on the through table do not send m2m_changed, the
+        # caches are invalidated by hand below
+        with transaction.atomic():
+            if self.validated_data['action'] == self.ACTION_ADD:
+                existing = set(memberships.values_list('user_id', 'group_id'))
+                new_memberships = [
+                    Membership(user_id=user_id, group_id=group_id)
+                    for user_id in user_ids
+                    for group_id in group_ids
+                    if (user_id, group_id) not in existing
+                ]
+                Membership.objects.bulk_create(new_memberships, ignore_conflicts=True)
+                # rows inserted concurrently are skipped by ignore_conflicts
+                # and must not be counted as changed by this request
+                changed = memberships.count() - len(existing)
+                User.objects.filter(pk__in=user_ids, is_admin=False).update(is_admin=True)
+            else:
+                changed, _ = memberships.delete()
+                # superusers stay admins without any group
+                User.objects.filter(
+                    pk__in=user_ids, is_admin=True, is_superuser=False, groups__isnull=True,
+                ).update(is_admin=False)
+
+            memberships_changed(user_ids)
+
+        return changed
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from admin import rbac
+
+
+@receiver([post_save, post_delete], sender=Group)
+def update_changed_group_snapshot(sender, instance, **kwargs):
+    rbac.update_groups([instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def update_changed_group_permissions_snapshot(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if not reverse:
+        rbac.update_groups([instance.pk])
+    elif action == 'post_clear':
+        # the groups of a cleared permission are unknown here
+        rbac.invalidate(rbac.GROUPS)
+    else:
+        rbac.update_groups(pk_set)
+
+
+@receiver([post_save, post_delete], sender=Permission)
+def invalidate_changed_permission_snapshots(sender, instance, **kwargs):
+    rbac.invalidate(rbac.PERMISSIONS)
+    rbac.invalidate(rbac.GROUPS)
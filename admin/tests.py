@@ -1,3 +1,179 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.models import User
+from core.testing import QueryBudgetMixin
+
+
+class GroupMembershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser(email="root@example.com", password="password")
+        cls.groups = Group.objects.bulk_create([Group(name=f"group-{i}") for i in range(10)])
+        cls.users = User.objects.bulk_create(
+            [User(email=f"user-{i}@example.com") for i in range(20)]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.superuser)
+
+    def post_memberships(self, action, users, groups):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/admin/groups/memberships/",
+                {"action": action, "users": users, "groups": groups},
+                format="json",
+            )
+        return response, len(queries)
+
+    def test_query_count_does_not_depend_on_payload_size(self):
+        _, small = self.post_memberships("add", [self.users[0].id], [self.groups[0].id])
+        response, large = self.post_memberships(
+            "add", [user.id for user in self.users[1:]], [group.id for group in self.groups[1:]],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["changed"], 19 * 9)
+        self.assertEqual(small, large)
+
+        _, small = self.post_memberships("remove", [self.users[0].id], [self.groups[0].id])
+        response, large = self.post_memberships(
+            "remove", [user.id for user in self.users[1:]], [group.id for group in self.groups[1:]],
+        )
+        self.assertEqual(response.data["changed"], 19 * 9)
+        self.assertEqual(small, large)
+        self.assertFalse(User.objects.filter(is_superuser=False, is_admin=True).exists())
+
+    def test_changed_counts_the_rows_written(self):
+        User.groups.through.objects.create(user=self.users[0], group=self.groups[0])
+        response, _ = self.post_memberships(
+            "add", [self.users[0].id, self.users[1].id], [self.groups[0].id, self.groups[1].id],
+        )
+        self.assertEqual(response.data["changed"], 3)
+        response, _ = self.post_memberships("add", [self.users[0].id], [self.groups[0].id])
+        self.assertEqual(response.data["changed"], 0)
+
+        response, _ = self.post_memberships("remove", [self.users[0].id, self.users[2].id], [self.groups[0].id])
+        self.assertEqual(response.data["changed"], 1)
+
+    def test_superusers_can_be_members(self):
+        response, _ = self.post_memberships("add", [self.superuser.id], [self.groups[0].id])
+        self.assertEqual((response.status_code, response.data["changed"]), (200, 1))
+        self.assertTrue(self.superuser.groups.filter(pk=self.groups[0].pk).exists())
+
+        response, _ = self.post_memberships("remove", [self.superuser.id], [self.groups[0].id])
+        self.assertEqual(response.data["changed"], 1)
+        self.superuser.refresh_from_db()
+        self.assertTrue(self.superuser.is_admin)
+
+    def test_unknown_ids_are_reported_together(self):
+        response, _ = self.post_memberships(
+            "add", [self.users[0].id, 9998, 9999], [self.groups[0].id, 9999],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("9998", str(response.data["users"]))
+        self.assertIn("9999", str(response.data["users"]))
+        self.assertIn("9999", str(response.data["groups"]))
+        self.assertFalse(User.groups.through.objects.filter(user=self.users[0]).exists())
+
+    def test_group_permissions_query_count_does_not_depend_on_payload_size(self):
+        permission_ids = list(Permission.objects.values_list("id", flat=True)[:30])
+        counts = []
+        for name, ids in [("editors", permission_ids[:1]), ("publishers", permission_ids)]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    "/admin/groups/",
+                    {"name": name, "permissions": [{"id": id} for id in ids]},
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class RBACSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser(email="root@example.com", password="password")
+        cls.group = Group.objects.create(name="editors")
+        cls.permission = Permission.objects.order_by("id").first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.superuser)
+
+    def test_warm_reads_cost_zero_queries(self):
+        for url in ["/admin/permissions/", "/admin/groups/", f"/admin/groups/{self.group.id}/"]:
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304)
+
+    def test_group_changes_update_the_snapshot(self):
+        etag = self.client.get("/admin/groups/")["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permission)
+
+        response = self.client.get("/admin/groups/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        group = next(group for group in response.data if group["id"] == self.group.id)
+        self.assertEqual([permission["id"] for permission in group["permissions"]], [self.permission.id])
+
+        group_id = self.group.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertEqual(self.client.get(f"/admin/groups/{group_id}/").status_code, 404)
+
+    @override_settings(ADMIN_RBAC_GENERATION_TIMEOUT=60)
+    def test_snapshots_expire(self):
+        self.client.get("/admin/groups/")
+        # a change made by another process with a process-local cache
+        Group.objects.filter(pk=self.group.pk).update(name="writers")
+        self.assertEqual(self.client.get(f"/admin/groups/{self.group.id}/").data["name"], "editors")
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertEqual(self.client.get(f"/admin/groups/{self.group.id}/").data["name"], "writers")
+
+
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    sizes = (10, 200)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser(email="root@example.com", password="password")
+        cls.group = Group.objects.create(name="group-0")
+        cls.group.permissions.set(Permission.objects.all())
+
+    def get_client(self):
+        client = super().get_client()
+        client.force_authenticate(self.superuser)
+        return client
+
+    def get_budgets(self):
+        return {
+            "/admin/groups/": 2,
+            f"/admin/groups/{self.group.id}/": 2,
+            "/admin/permissions/": 1,
+        }
+
+    def seed(self, size):
+        start = Group.objects.count()
+        groups = Group.objects.bulk_create([Group(name=f"group-{i}") for i in range(start, size)])
+        permissions = list(Permission.objects.all())
+        Group.permissions.through.objects.bulk_create([
+            Group.permissions.through(group=group, permission=permission)
+            for group in groups
+            for permission in permissions
+        ])
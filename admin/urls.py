@@ -1,12 +1,13 @@
 from django.urls import path
 from rest_framework import routers
 
-from .views import GroupViewSet, PermissionListView
+from .views import GroupMembershipView, GroupViewSet, PermissionListView
 
 router = routers.SimpleRouter()
 
 router.register("groups", GroupViewSet, basename="group")
 
 urlpatterns = [
-    path("permissions/", PermissionListView.as_view(), name="permission-list")
+    path("permissions/", PermissionListView.as_view(), name="permission-list"),
+    path("groups/memberships/", GroupMembershipView.as_view(), name="group-memberships"),
 ] + router.urls
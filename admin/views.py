@@ -1,12 +1,28 @@
-from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.models import Group
+from django.http import Http404
+from django.utils.cache import get_conditional_response
 from rest_framework import status
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from . import rbac
 from .permissions import IsSuperUser
-from .serializers import GroupListRetrieveSerializer, GroupCreateUpdateSerializer, PermissionSerializer
+from .serializers import (
+    GroupCreateUpdateSerializer,
+    GroupListRetrieveSerializer,
+    GroupMembershipSerializer,
+)
+
+
+def snapshot_response(request, version, data):
+    etag = f'"{version}-{request.accepted_renderer.format}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(data)
+    response['ETag'] = etag
+    return response
 
 
 class GroupViewSet(ModelViewSet):
@@ -17,6 +33,18 @@ class GroupViewSet(ModelViewSet):
         if self.request.method in SAFE_METHODS:
             return GroupListRetrieveSerializer
         return GroupCreateUpdateSerializer
+
+    def list(self, request, *args, **kwargs):
+        version, groups = rbac.get_snapshot(rbac.GROUPS)
+        return snapshot_response(request, version, list(groups.values()))
+
+    def retrieve(self, request, *args, **kwargs):
+        version, groups = rbac.get_snapshot(rbac.GROUPS)
+        try:
+            group = groups[int(kwargs[self.lookup_field])]
+        except (KeyError, ValueError):
+            raise Http404
+        return snapshot_response(request, version, group)
     
     def destroy(self, request, *args, **kwargs):
         group = self.get_object()
@@ -32,6 +60,18 @@ class PermissionListView(APIView):
     permission_classes = (IsSuperUser, )
 
     def get(self, request):
-        permission_queryset = Permission.objects.all().order_by('id')
-        serializer = PermissionSerializer(permission_queryset, many=True)
-        return Response(serializer.data)
+        version, permissions = rbac.get_snapshot(rbac.PERMISSIONS)
+        return snapshot_response(request, version, permissions)
+
+
+class GroupMembershipView(APIView):
+    """
+    Adds or removes all the given users to or from all the given groups.
+    """
+    permission_classes = (IsSuperUser, )
+
+    def post(self, request):
+        serializer = GroupMembershipSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changed = serializer.save()
+        return Response({**serializer.data, 'changed': changed})
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 from environs import Env
@@ -47,16 +48,20 @@ INSTALLED_APPS = [
 
     # third-party
     'rest_framework',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    'core.metrics.MetricsMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS += ['debug_toolbar', ]
+    MIDDLEWARE.insert(0, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -92,9 +97,79 @@ DATABASES = {
         'HOST': env.str("DB_HOST"),
         'USER': env.str("DB_USER"),
         'PASSWORD': env.str("DB_PASSWORD"),
+        # closed at the end of every request by default; set DB_CONN_MAX_AGE
+        # only under a WSGI server, whose worker threads outlive the requests.
+        # Under ASGI every request may run in a new thread and leave its
+        # connection behind, use the pooled backend (DB_ENGINE=core.backends.mysql)
+        'CONN_MAX_AGE': env.int("DB_CONN_MAX_AGE", default=0),
+        'CONN_HEALTH_CHECKS': env.bool("DB_CONN_HEALTH_CHECKS", default=True),
+        # used by core.pool
+        'POOL': {
+            'MAX_SIZE': env.int("DB_POOL_MAX_SIZE", default=10),
+            'TIMEOUT': env.int("DB_POOL_TIMEOUT", default=10),
+            'MAX_AGE': env.int("DB_POOL_MAX_AGE", default=300),
+        },
+        # SQLite tests run in a shared in-memory database unless this names a
+        # file, the concurrency tests need a file
+        'TEST': {
+            'NAME': env.str("DB_TEST_NAME", default=None),
+        },
+    }
+}
+
+if DATABASES['default']['ENGINE'] in ['django.db.backends.sqlite3', 'core.backends.sqlite3']:
+    # take the write lock when the transaction begins, a deferred transaction
+    # fails with "database is locked" when it cannot upgrade under contention
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+
+# Read replicas as JSON, {"replica": {"ENGINE": ..., "NAME": ..., "WEIGHT": 2}, ...}.
+# Safe-method requests read from them through core.replicas, weighted by WEIGHT.
+DATABASE_REPLICAS = {}
+for alias, replica in env.json("DB_REPLICAS", default={}).items():
+    DATABASE_REPLICAS[alias] = replica.pop('WEIGHT', 1)
+    # the test database of a replica is the primary's
+    DATABASES[alias] = {**replica, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# requests under these paths (auth and password flows) always use the primary
+DATABASE_PRIMARY_PATHS = ['/auth/']
+# reads of a client stay on the primary this long after it wrote
+DATABASE_STICKY_SECONDS = env.int("DB_STICKY_SECONDS", default=10)
+DATABASE_STICKY_COOKIE = 'db_primary_until'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# The shop response cache and its tag versions (which also back the list
+# ETags) must be shared by all workers in production, `check --deploy`
+# rejects the process-local default
+CACHES = {
+    'default': {
+        'BACKEND': env.str("CACHE_BACKEND", default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env.str("CACHE_LOCATION", default=''),
     }
 }
 
+SHOP_RESPONSE_CACHE_TIMEOUT = env.int("SHOP_RESPONSE_CACHE_TIMEOUT", default=60 * 60)
+
+# group memberships and token claims versions are cached at most this long.
+# Invalidations reach other processes only through a shared cache, with the
+# process-local default this bounds how long a revoked role keeps working
+AUTH_CACHE_TIMEOUT = env.int("AUTH_CACHE_TIMEOUT", default=60)
+
+
+# Password hashing runs on a bounded thread pool (core.hashing), requests
+# beyond the pending limit are rejected with 503 and Retry-After. The pool
+# takes at most half of the cores, and MAX_WORKERS + MAX_PENDING should stay
+# below the request threads of a worker process so that a login storm can
+# never hold all of them
+
+PASSWORD_HASHING_MAX_WORKERS = env.int("PASSWORD_HASHING_MAX_WORKERS", default=max(1, (os.cpu_count() or 2) // 2))
+PASSWORD_HASHING_MAX_PENDING = env.int("PASSWORD_HASHING_MAX_PENDING", default=8)
+PASSWORD_HASHING_RETRY_AFTER = env.int("PASSWORD_HASHING_RETRY_AFTER", default=1)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -139,15 +214,38 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'core.authentication.ClaimsJWTAuthentication',
+    ),
+    # token buckets of core.throttling, "10/min" is 10 tokens refilled per minute
+    'DEFAULT_THROTTLE_RATES': {
+        'signup': env.str("THROTTLE_RATE_SIGNUP", default='10/hour'),
+        'login': env.str("THROTTLE_RATE_LOGIN", default='20/min'),
+        'password': env.str("THROTTLE_RATE_PASSWORD", default='10/min'),
+        'password_reset': env.str("THROTTLE_RATE_PASSWORD_RESET", default='5/hour'),
+        'product_write': env.str("THROTTLE_RATE_PRODUCT_WRITE", default='120/min'),
+    },
 }
 
+# in-flight requests per process above which core.throttling.LoadSheddingMixin rejects
+AUTH_MAX_IN_FLIGHT = env.int("AUTH_MAX_IN_FLIGHT", default=16)
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT', ),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.TokenRefreshSerializer',
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+EMAIL_BACKEND = env.str("EMAIL_BACKEND", default='django.core.mail.backends.console.EmailBackend')
+
+# Outbox of core.outbox, drained by `manage.py send_queued_emails`
+EMAIL_OUTBOX_DEDUPE_WINDOW = env.int("EMAIL_OUTBOX_DEDUPE_WINDOW", default=15 * 60)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int("EMAIL_OUTBOX_MAX_ATTEMPTS", default=5)
+EMAIL_OUTBOX_RETRY_DELAY = env.int("EMAIL_OUTBOX_RETRY_DELAY", default=60)
+EMAIL_OUTBOX_MAX_RETRY_DELAY = env.int("EMAIL_OUTBOX_MAX_RETRY_DELAY", default=60 * 60)
+# a claimed message is retried after this long if its worker never reports back
+EMAIL_OUTBOX_CLAIM_TIMEOUT = env.int("EMAIL_OUTBOX_CLAIM_TIMEOUT", default=5 * 60)
+# sent messages are pruned after this long, it must exceed the dedupe window
+EMAIL_OUTBOX_RETENTION = env.int("EMAIL_OUTBOX_RETENTION", default=7 * 24 * 60 * 60)
 
 AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
@@ -14,11 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path, include
 
+from core.views import MetricsView
+
 urlpatterns = [
     path('auth/', include('core.urls')),
     path('admin/', include('admin.urls')),
     path('shop/', include("shop.urls")),
-    path("__debug__/", include("debug_toolbar.urls")),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
+
+if settings.DEBUG:
+    urlpatterns += [
+        path("__debug__/", include("debug_toolbar.urls")),
+    ]
@@ -7,3 +7,7 @@ class CoreConfig(AppConfig):
 
     def ready(self) -> None:
         from .signals import handlers
+
+        from .metrics import register_collector
+        from .pool import get_metrics
+        register_collector(get_metrics)
@@ -0,0 +1,119 @@
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .groups import get_timeout, get_user_groups, invalidate_user_groups
+from .models import User
+from .replicas import primary_reads
+
+
+CLAIMS_VERSION_CLAIM = "cv"
+
+
+def claims_version_key(user_id):
+    return f'core:claims-version:{user_id}'
+
+
+def get_claims_version(user_id):
+    key = claims_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # a lagging replica would accept revoked claims, and cache them
+        version = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list("claims_version", flat=True).first()
+        if version is not None:
+            cache.set(key, version, timeout=get_timeout())
+    return version
+
+
+def bump_claims_version(user_ids):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    User.objects.filter(pk__in=user_ids).update(claims_version=F("claims_version") + 1)
+
+    keys = [claims_version_key(user_id) for user_id in user_ids]
+
+    def invalidate():
+        cache.delete_many(keys)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def memberships_changed(user_ids):
+    """
+    Drops the cached groups and token claims of the users. Bulk operations on
+    User.groups.through do not send m2m_changed, so they call it themselves.
+    """
+    user_ids = list(user_ids)
+    invalidate_user_groups(user_ids)
+    bump_claims_version(user_ids)
+
+
+def add_user_claims(token, user):
+    token["email"] = user.email
+    token["is_superuser"] = user.is_superuser
+    token["is_admin"] = user.is_admin
+    token["groups"] = sorted(get_user_groups(user))
+    token[CLAIMS_VERSION_CLAIM] = user.claims_version
+    return token
+
+
+class ClaimsUser(TokenUser):
+    """
+    Lightweight user built from the signed token claims. The User row is only
+    loaded when a view needs the model, and then at most once per request.
+    """
+    @cached_property
+    def email(self):
+        return self.token.get("email", "")
+
+    @cached_property
+    def is_admin(self):
+        return self.token.get("is_admin", False)
+
+    @cached_property
+    def group_ids(self):
+        return self.token.get("groups", [])
+
+    @cached_property
+    def instance(self):
+        return User.objects.get(pk=self.id)
+
+    def get_username(self):
+        return self.email
+
+    def __str__(self):
+        return self.email
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Trusts the role claims of the token as long as its claims version is the
+    user's current one, and falls back to loading the user from the database
+    once the roles have changed.
+    """
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        token_version = validated_token.get(CLAIMS_VERSION_CLAIM)
+        if token_version is not None and token_version == get_claims_version(user_id):
+            return ClaimsUser(validated_token)
+        # the roles have just changed, a replica may not have seen it yet
+        with primary_reads():
+            return super().get_user(validated_token)
+
+
+def get_user_instance(request):
+    user = request.user
+    if isinstance(user, ClaimsUser):
+        return user.instance
+    return user
@@ -0,0 +1,16 @@
+from django.db.backends.mysql import base
+
+from core.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    MySQL backend with a per-process connection pool, configured with the
+    POOL dict of the database settings (MAX_SIZE, TIMEOUT, MAX_AGE).
+    """
+    def check_connection(self, connection):
+        try:
+            connection.ping()
+        except Exception:
+            return False
+        return True
@@ -0,0 +1,12 @@
+from django.db.backends.sqlite3 import base
+
+from core.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    SQLite backend with the per-process connection pool of the MySQL one, so
+    that pooling can be measured (and compared with CONN_MAX_AGE) without a
+    MySQL server. Only file databases are pooled, Django never closes the
+    connection of an in-memory one.
+    """
@@ -0,0 +1,664 @@
+import asyncio
+import json
+import platform
+import resource
+import sys
+import tempfile
+import threading
+from contextlib import ExitStack
+from statistics import mean
+from time import perf_counter
+
+import django
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Max
+from django.test import Client
+from django.utils import timezone
+
+from shop import cache as response_cache
+from shop.importers import ROW_READERS, ProductImporter, decode_lines
+from shop.models import Cart, Order, Product
+
+from .metrics import QueryRecorder
+from .models import User
+
+
+BENCHMARK_USER_EMAIL = "bench-user@example.com"
+BENCHMARK_ADMIN_EMAIL = "bench-admin@example.com"
+BENCHMARK_PASSWORD = "bench-password"
+
+# metric: the direction in which it improves
+COMPARED_METRICS = {
+    'p50_ms': 'lower',
+    'p95_ms': 'lower',
+    'p99_ms': 'lower',
+    'requests_per_second': 'higher',
+    'queries_per_request': 'lower',
+    'rows_per_second': 'higher',
+    'peak_memory_kb': 'lower',
+}
+
+
+class Scenario:
+    """
+    A named request (or sequence of requests, see `steps`) that is timed
+    `iterations * weight` times. `setup` runs once and may store state on
+    the runner, e.g. ids discovered through the API, `teardown` undoes what
+    the scenario changed in the database.
+    """
+    def __init__(self, name, path=None, method='get', user=None, data=None, weight=1,
+                 headers=None, steps=None, setup=None, teardown=None, expected_status=(200, )):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.user = user
+        self.data = data
+        self.weight = weight
+        self.headers = headers
+        self.steps = steps
+        self.setup = setup
+        self.teardown = teardown
+        self.expected_status = expected_status
+
+    def run(self, runner, client):
+        if self.steps:
+            return self.steps(runner, client)
+        path = self.path(runner) if callable(self.path) else self.path
+        data = self.data(runner) if callable(self.data) else self.data
+        headers = self.headers(runner) if callable(self.headers) else (self.headers or {})
+        return [runner.request(client, self.method, path, data, self.user, headers)]
+
+
+def discover_ids(runner):
+    response = runner.request(runner.client, 'get', '/shop/products/?ordering=-id', None, None, {})
+    products = response.json()['results']
+    if not products:
+        raise RuntimeError("No products found, run the seed command first.")
+    runner.state['product_id'] = products[0]['id']
+    runner.state['commented_product_id'] = max(products, key=lambda product: product['comment_count'])['id']
+    runner.state['search_term'] = products[0]['name'].split()[0]
+
+
+def prepare_conditional_get(runner):
+    response = runner.request(runner.client, 'get', f"/shop/products/{runner.state['product_id']}/", None, None, {})
+    runner.state['product_etag'] = response['ETag']
+
+
+def prepare_comment_pages(runner):
+    response = runner.request(
+        runner.client, 'get', f"/shop/products/{runner.state['commented_product_id']}/comments/", None, None, {},
+    )
+    next_link = response.json()['next']
+    if next_link is None:
+        raise RuntimeError("The most commented product has a single page of comments, seed more comments.")
+    runner.state['comments_next_page'] = next_link.removeprefix('http://testserver')
+
+
+def prepare_checkout(runner):
+    # every checkout takes one unit, the product must not run out (5% of the
+    # seeded products start with none) and keeps its stock afterwards
+    product = Product.objects.get(pk=runner.state['product_id'])
+    runner.state['checkout_restore'] = {
+        'inventory': product.inventory,
+        'datetime_modified': product.datetime_modified,
+        'last_order_id': Order.objects.aggregate(last_id=Max('id'))['last_id'] or 0,
+        'started': timezone.now(),
+    }
+    Product.objects.filter(pk=product.pk).update(inventory=runner.iterations + runner.warmup)
+
+
+def restore_checkout(runner):
+    restore = runner.state.pop('checkout_restore')
+    product_id = runner.state['product_id']
+    with transaction.atomic():
+        Order.objects.filter(pk__gt=restore['last_order_id'], user__email=BENCHMARK_USER_EMAIL).delete()
+        # carts left behind by failed checkouts
+        Cart.objects.filter(created_at__gte=restore['started'], items__product_id=product_id).delete()
+        Product.objects.filter(pk=product_id).update(
+            inventory=restore['inventory'], datetime_modified=restore['datetime_modified'],
+        )
+    response_cache.invalidate_tags([response_cache.PRODUCT_LIST_TAG, response_cache.product_tag(product_id)])
+
+
+def checkout(runner, client):
+    responses = [runner.request(client, 'post', '/shop/carts/', {}, None, {})]
+    cart_id = responses[0].json()['id']
+    responses.append(runner.request(
+        client, 'post', f'/shop/carts/{cart_id}/items/',
+        {'product_id': runner.state['product_id'], 'quantity': 1}, None, {},
+    ))
+    responses.append(runner.request(client, 'post', '/shop/orders/', {'cart_id': cart_id}, 'user', {}))
+    return responses
+
+
+SCENARIOS = [
+    Scenario('product_list', '/shop/products/'),
+    Scenario('product_list_cursor', '/shop/products/?pagination=cursor&ordering=-inventory'),
+    Scenario('product_search', lambda runner: f"/shop/products/?search={runner.state['search_term']}"),
+    Scenario('product_order_by_inventory', '/shop/products/?ordering=-inventory'),
+    Scenario('product_detail', lambda runner: f"/shop/products/{runner.state['product_id']}/"),
+    Scenario(
+        'product_detail_not_modified',
+        lambda runner: f"/shop/products/{runner.state['product_id']}/",
+        headers=lambda runner: {'HTTP_IF_NONE_MATCH': runner.state['product_etag']},
+        setup=prepare_conditional_get,
+        expected_status=(304, ),
+    ),
+    Scenario('product_comments', lambda runner: f"/shop/products/{runner.state['commented_product_id']}/comments/"),
+    Scenario(
+        'product_comments_next_page', lambda runner: runner.state['comments_next_page'],
+        setup=prepare_comment_pages,
+    ),
+    Scenario('category_list', '/shop/categories/'),
+    Scenario(
+        'jwt_create', '/auth/jwt/create/', method='post',
+        data={'email': BENCHMARK_USER_EMAIL, 'password': BENCHMARK_PASSWORD},
+        # password hashing dominates, a few samples are enough
+        weight=0.05,
+    ),
+    Scenario('user_me', '/auth/users/me/', user='user'),
+    Scenario('group_list', '/admin/groups/', user='admin'),
+    Scenario('permission_list', '/admin/permissions/', user='admin'),
+    Scenario(
+        'checkout', steps=checkout, weight=0.2, expected_status=(200, 201),
+        setup=prepare_checkout, teardown=restore_checkout,
+    ),
+]
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def current_rss_kb():
+    # Linux only, unlike the peak there is no portable way to read it
+    try:
+        with open('/proc/self/statm') as stream:
+            return int(stream.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return None
+
+
+class BenchmarkRunner:
+    """
+    Drives the WSGI handler in process through django.test.Client and
+    records latency, queries per request and peak RSS for every scenario.
+    """
+    def __init__(self, iterations=200, warmup=10, scenarios=None, clear_cache=False, stdout=None):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.scenarios = scenarios or SCENARIOS
+        self.clear_cache = clear_cache
+        self.stdout = stdout
+        self.client = Client()
+        self.state = {}
+        self.tokens = {}
+        self.recorder = None
+
+    def ensure_users(self):
+        for email, is_superuser in [(BENCHMARK_USER_EMAIL, False), (BENCHMARK_ADMIN_EMAIL, True)]:
+            if not User.objects.filter(email=email).exists():
+                create = User.objects.create_superuser if is_superuser else User.objects.create_user
+                create(email=email, password=BENCHMARK_PASSWORD)
+
+        for user, email in [('user', BENCHMARK_USER_EMAIL), ('admin', BENCHMARK_ADMIN_EMAIL)]:
+            response = self.client.post(
+                '/auth/jwt/create/', {'email': email, 'password': BENCHMARK_PASSWORD},
+                content_type='application/json',
+            )
+            self.tokens[user] = response.json()['access']
+
+    def request(self, client, method, path, data, user, headers):
+        if user is not None:
+            headers = {**headers, 'HTTP_AUTHORIZATION': f'JWT {self.tokens[user]}'}
+        if self.clear_cache:
+            cache.clear()
+        kwargs = {}
+        if data is not None:
+            kwargs = {'data': json.dumps(data), 'content_type': 'application/json'}
+        response = getattr(client, method)(path, **kwargs, **headers)
+        # the test client keeps connections open across requests, a server
+        # closes (or returns to the pool) those past CONN_MAX_AGE
+        close_old_connections()
+        return response
+
+    def run_scenario(self, scenario):
+        if scenario.setup:
+            scenario.setup(self)
+        try:
+            return self.time_scenario(scenario)
+        finally:
+            if scenario.teardown:
+                scenario.teardown(self)
+
+    def time_scenario(self, scenario):
+        iterations = max(1, int(self.iterations * scenario.weight))
+        warmup = max(1, int(self.warmup * scenario.weight))
+
+        for _ in range(warmup):
+            scenario.run(self, self.client)
+
+        latencies, queries, requests, errors = [], 0, 0, 0
+        recorder = QueryRecorder()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            for _ in range(iterations):
+                start = perf_counter()
+                responses = scenario.run(self, self.client)
+                latencies.append(perf_counter() - start)
+                requests += len(responses)
+                errors += sum(response.status_code not in scenario.expected_status for response in responses)
+        elapsed = perf_counter() - started
+
+        return {
+            'iterations': iterations,
+            'requests': requests,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'mean_ms': round(mean(latencies) * 1000, 3),
+            'requests_per_second': round(requests / elapsed, 1),
+            'queries_per_request': round(recorder.queries / requests, 2),
+            'peak_rss_kb': peak_rss_kb(),
+        }
+
+    def run(self):
+        self.ensure_users()
+        discover_ids(self)
+
+        results = {}
+        for scenario in self.scenarios:
+            results[scenario.name] = self.run_scenario(scenario)
+            if self.stdout:
+                result = results[scenario.name]
+                self.stdout.write(
+                    f"{scenario.name:<30} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                    f"p99 {result['p99_ms']:>9.2f}ms  {result['requests_per_second']:>8.1f} req/s  "
+                    f"{result['queries_per_request']:>6.2f} q/req  errors {result['errors']}"
+                )
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections['default'].vendor,
+                'engine': connections['default'].settings_dict['ENGINE'],
+                'conn_max_age': connections['default'].settings_dict['CONN_MAX_AGE'],
+                'iterations': self.iterations,
+                'clear_cache': self.clear_cache,
+            },
+            'scenarios': results,
+        }
+
+
+# (name, sync path, async path), {product_id} is filled in by discover_ids()
+ASGI_ENDPOINTS = [
+    ('product_list', '/shop/products/', '/shop/async/products/'),
+    ('product_detail', '/shop/products/{product_id}/', '/shop/async/products/{product_id}/'),
+    ('category_list', '/shop/categories/', '/shop/async/categories/'),
+]
+
+
+class ASGIBenchmarkRunner:
+    """
+    Opens `clients` concurrent connections against the ASGI application,
+    each sending `requests_per_client` requests one after the other, and
+    compares the sync viewsets with the async views. Every response chunk is
+    acknowledged after `send_delay` seconds to model slow clients.
+    """
+    def __init__(self, clients=1000, requests_per_client=5, send_delay=0.0, clear_cache=False, stdout=None):
+        self.clients = clients
+        self.requests_per_client = requests_per_client
+        self.send_delay = send_delay
+        self.clear_cache = clear_cache
+        self.stdout = stdout
+        self.application = get_asgi_application()
+        self.requests_sent = 0
+
+    async def request(self, path):
+        path, _, query_string = path.partition('?')
+        if self.clear_cache:
+            # a new cache key for every request of the sync views
+            self.requests_sent += 1
+            query_string = f"{query_string}&_={self.requests_sent}".lstrip('&')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'headers': [(b'host', b'testserver'), (b'connection', b'keep-alive')],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        done = asyncio.Event()
+        status = []
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                if self.send_delay:
+                    await asyncio.sleep(self.send_delay)
+                if not message.get('more_body'):
+                    done.set()
+
+        start = perf_counter()
+        await self.application(scope, receive, send)
+        done.set()
+        return perf_counter() - start, status[0] if status else None
+
+    async def run_client(self, path, latencies, errors):
+        for _ in range(self.requests_per_client):
+            seconds, status = await self.request(path)
+            latencies.append(seconds)
+            if status != 200:
+                errors.append(status)
+
+    async def sample_threads(self, peak, stop):
+        while not stop.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def run_endpoint(self, path):
+        latencies, errors, peak = [], [], [threading.active_count()]
+        stop = asyncio.Event()
+        sampler = asyncio.ensure_future(self.sample_threads(peak, stop))
+        started = perf_counter()
+        await asyncio.gather(*(self.run_client(path, latencies, errors) for _ in range(self.clients)))
+        elapsed = perf_counter() - started
+        stop.set()
+        await sampler
+        return {
+            'clients': self.clients,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'mean_ms': round(mean(latencies) * 1000, 3),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'peak_threads': peak[0],
+            'peak_rss_kb': peak_rss_kb(),
+        }
+
+    def run(self):
+        discovery = BenchmarkRunner()
+        discover_ids(discovery)
+        results = {}
+        for name, sync_path, async_path in ASGI_ENDPOINTS:
+            for variant, path in [('sync', sync_path), ('async', async_path)]:
+                key = f'asgi_{name}_{variant}'
+                results[key] = asyncio.run(self.run_endpoint(path.format(**discovery.state)))
+                if self.stdout:
+                    result = results[key]
+                    self.stdout.write(
+                        f"{key:<30} p50 {result['p50_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+                        f"{result['requests_per_second']:>8.1f} req/s  threads {result['peak_threads']:>4}  "
+                        f"errors {result['errors']}"
+                    )
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections['default'].vendor,
+                'clients': self.clients,
+                'requests_per_client': self.requests_per_client,
+                'send_delay': self.send_delay,
+                'clear_cache': self.clear_cache,
+            },
+            'scenarios': results,
+        }
+
+
+class TransferBenchmarkRunner:
+    """
+    Streams the product export of every format through the API into a
+    temporary file, then imports the CSV and NDJSON files back with
+    ProductImporter (updating every product). Records the throughput of each
+    run and how much its RSS peaked above the RSS it started with (sampled,
+    Linux only), which must not grow with the number of products.
+    """
+    export_formats = ['csv', 'ndjson', 'json']
+    import_formats = ['csv', 'ndjson']
+
+    def __init__(self, batch_size=1000, stdout=None):
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+    sample_interval = 0.01
+
+    def sample_rss(self, peak, stop):
+        while not stop.wait(self.sample_interval):
+            peak[0] = max(peak[0], current_rss_kb())
+
+    def measure(self, function):
+        baseline = current_rss_kb()
+        peak, stop = [baseline], threading.Event()
+        sampler = threading.Thread(target=self.sample_rss, args=(peak, stop))
+        if baseline is not None:
+            sampler.start()
+        started = perf_counter()
+        try:
+            rows, size = function()
+        finally:
+            elapsed = perf_counter() - started
+            stop.set()
+            if sampler.is_alive():
+                sampler.join()
+        return {
+            'rows': rows,
+            'bytes': size,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+            'peak_memory_kb': max(peak[0], current_rss_kb()) - baseline if baseline is not None else None,
+        }
+
+    def export(self, runner, export_format, stream):
+        response = runner.request(
+            runner.client, 'get', f'/shop/products/export/{export_format}/', None, 'user', {},
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"The {export_format} export returned {response.status_code}.")
+        size = 0
+        for chunk in response.streaming_content:
+            stream.write(chunk)
+            size += len(chunk)
+        response.close()
+        return Product.objects.count(), size
+
+    def import_file(self, import_format, stream):
+        stream.seek(0)
+        rows = ROW_READERS[import_format](decode_lines(stream))
+        report = ProductImporter(batch_size=self.batch_size).run(rows)
+        if report['error_count']:
+            raise RuntimeError(f"The {import_format} import failed for {report['error_count']} rows.")
+        return report['processed'], stream.tell()
+
+    def report(self, name, result):
+        if self.stdout:
+            self.stdout.write(
+                f"{name:<30} {result['rows']:>9} rows  {result['seconds']:>8.2f}s  "
+                f"{result['rows_per_second']:>9.1f} rows/s  {result['bytes'] / 1024 / 1024:>8.1f}MB  "
+                f"peak +{result['peak_memory_kb']} KB"
+            )
+
+    def run(self):
+        runner = BenchmarkRunner()
+        runner.ensure_users()
+        results = {}
+        for export_format in self.export_formats:
+            with tempfile.TemporaryFile() as stream:
+                name = f'export_{export_format}'
+                results[name] = self.measure(lambda: self.export(runner, export_format, stream))
+                self.report(name, results[name])
+                if export_format in self.import_formats:
+                    name = f'import_{export_format}'
+                    results[name] = self.measure(lambda: self.import_file(export_format, stream))
+                    self.report(name, results[name])
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections['default'].vendor,
+                'products': Product.objects.count(),
+                'batch_size': self.batch_size,
+            },
+            'scenarios': results,
+        }
+
+
+def summarize_latencies(latencies, elapsed):
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(mean(latencies) * 1000, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+    }
+
+
+class LoginStormBenchmarkRunner:
+    """
+    Times `iterations` catalog requests alone, then again while `logins`
+    threads keep posting to /auth/jwt/create/, to show how much the password
+    hashing of a login storm (bounded by core.hashing) takes away from the
+    rest of the process. Logins rejected by the hashing pool or the load
+    shedding are counted, not timed as errors.
+    """
+    catalog_path = '/shop/products/'
+
+    def __init__(self, logins=8, iterations=200, clear_cache=False, stdout=None):
+        self.logins = logins
+        self.iterations = iterations
+        self.clear_cache = clear_cache
+        self.stdout = stdout
+
+    def login_loop(self, runner, stop, latencies, statuses):
+        client = Client()
+        data = {'email': BENCHMARK_USER_EMAIL, 'password': BENCHMARK_PASSWORD}
+        try:
+            while not stop.is_set():
+                start = perf_counter()
+                response = runner.request(client, 'post', '/auth/jwt/create/', data, None, {})
+                latencies.append(perf_counter() - start)
+                statuses.append(response.status_code)
+                # like a well-behaved client, instead of retrying in a busy loop
+                if response.has_header('Retry-After'):
+                    stop.wait(int(response['Retry-After']))
+        finally:
+            connections.close_all()
+
+    def time_catalog(self, runner):
+        latencies, errors = [], 0
+        started = perf_counter()
+        for _ in range(self.iterations):
+            start = perf_counter()
+            response = runner.request(runner.client, 'get', self.catalog_path, None, None, {})
+            latencies.append(perf_counter() - start)
+            errors += response.status_code != 200
+        return {**summarize_latencies(latencies, perf_counter() - started), 'errors': errors}
+
+    def report(self, name, result):
+        if self.stdout:
+            self.stdout.write(
+                f"{name:<30} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                f"p99 {result['p99_ms']:>9.2f}ms  {result['requests_per_second']:>8.1f} req/s  "
+                f"errors {result['errors']}"
+            )
+
+    def run(self):
+        runner = BenchmarkRunner(clear_cache=self.clear_cache)
+        runner.ensure_users()
+        # warm up the connections and the response cache
+        for _ in range(10):
+            runner.request(runner.client, 'get', self.catalog_path, None, None, {})
+
+        results = {'catalog_idle': self.time_catalog(runner)}
+        self.report('catalog_idle', results['catalog_idle'])
+
+        latencies, statuses, stop = [], [], threading.Event()
+        threads = [
+            threading.Thread(target=self.login_loop, args=(runner, stop, latencies, statuses))
+            for _ in range(self.logins)
+        ]
+        started = perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            results['catalog_during_login_storm'] = self.time_catalog(runner)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        elapsed = perf_counter() - started
+        self.report('catalog_during_login_storm', results['catalog_during_login_storm'])
+
+        accepted = [latency for latency, status in zip(latencies, statuses) if status == 200]
+        results['login_storm'] = {
+            **summarize_latencies(accepted or [0], elapsed),
+            'requests': len(statuses),
+            'rejected': sum(status in (429, 503) for status in statuses),
+            'errors': sum(status not in (200, 429, 503) for status in statuses),
+        }
+        self.report('login_storm', results['login_storm'])
+        if self.stdout:
+            self.stdout.write(f"{'':<30} {results['login_storm']['rejected']} of {len(statuses)} logins rejected")
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections['default'].vendor,
+                'logins': self.logins,
+                'iterations': self.iterations,
+                'clear_cache': self.clear_cache,
+            },
+            'scenarios': results,
+        }
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the regressions of `results` against `baseline`, metrics that got
+    worse by more than `threshold` (a fraction, 0.1 is 10%).
+    """
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (direction == 'lower' and change > threshold) or (direction == 'higher' and -change > threshold):
+                regressions.append((name, metric, old, new, change))
+    return regressions
@@ -8,3 +8,4 @@ class Messages:
     EMAIL_NOT_FOUND = _("User with given email does not exist.")
     INVALID_TOKEN_ERROR = _("Invalid token for given user.")
     INVALID_UID_ERROR = _("Invalid user id or user doesn't exist.")
+    INVALID_IDS_ERROR = _("Invalid ids: {ids}.")
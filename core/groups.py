@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+def get_timeout():
+    return getattr(settings, 'AUTH_CACHE_TIMEOUT', 60)
+
+
+def user_groups_key(user_id):
+    return f'core:user-groups:{user_id}'
+
+
+def get_user_groups(user):
+    """
+    Returns {group id: group name} for the user, cached until one of the
+    membership signals in core.signals.handlers invalidates it or for
+    AUTH_CACHE_TIMEOUT seconds, whichever comes first.
+    """
+    if not user.is_authenticated:
+        return {}
+
+    key = user_groups_key(user.id)
+    groups = cache.get(key)
+    if groups is None:
+        # cached, so never read from a replica that may lag behind a change
+        groups = dict(Group.objects.using(DEFAULT_DB_ALIAS).filter(user=user.id).values_list('id', 'name'))
+        cache.set(key, groups, timeout=get_timeout())
+    return groups
+
+
+def is_in_group(user, group_name):
+    return group_name in get_user_groups(user).values()
+
+
+def invalidate_user_groups(user_ids):
+    keys = [user_groups_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+
+    def invalidate():
+        cache.delete_many(keys)
+
+    # once now and once after commit, so a concurrent request cannot
+    # re-cache the memberships that are about to change
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class HashingUnavailable(Exception):
+    """
+    Raised when the hashing pool is full, the views answer it with a 503
+    (see core.views.PasswordHashingMixin).
+    """
+    def __init__(self, retry_after=None):
+        super().__init__("Too many password operations in progress.")
+        self.retry_after = retry_after
+
+
+class HashingPool:
+    """
+    Runs password hashing and verification on a dedicated executor of
+    `max_workers` threads, with up to `max_pending` more operations queued.
+    The hashers spend their time in C code that releases the GIL, so the
+    executor size bounds the CPU they take away from the rest of the process.
+    Beyond the pending limit new operations fail fast, so a login storm holds
+    at most max_workers + max_pending request threads.
+    """
+    def __init__(self, max_workers, max_pending, retry_after):
+        self.max_workers = max_workers
+        self.retry_after = retry_after
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        # created lazily so that forking servers do not inherit the threads
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="password-hashing",
+                    )
+        return self.executor
+
+    def submit(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingUnavailable(retry_after=self.retry_after)
+        try:
+            future = self.get_executor().submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda future: self.slots.release())
+        return future
+
+    def run(self, func, *args):
+        return self.submit(func, *args).result()
+
+    async def arun(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    max_workers=settings.PASSWORD_HASHING_MAX_WORKERS,
+                    max_pending=settings.PASSWORD_HASHING_MAX_PENDING,
+                    retry_after=settings.PASSWORD_HASHING_RETRY_AFTER,
+                )
+    return _pool
+
+
+def make_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return get_pool().run(hashers.make_password, password)
+
+
+async def amake_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return await get_pool().arun(hashers.make_password, password)
+
+
+def check_password(password, encoded, setter=None):
+    # the hash upgrade (setter) writes to the database, so it runs on the
+    # calling thread rather than on the pool
+    is_correct, must_update = get_pool().run(hashers.verify_password, password, encoded)
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
+
+
+async def acheck_password(password, encoded, setter=None):
+    is_correct, must_update = await get_pool().arun(hashers.verify_password, password, encoded)
+    if setter and is_correct and must_update:
+        await setter(password)
+    return is_correct
@@ -0,0 +1,118 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.benchmark import (
+    SCENARIOS, ASGIBenchmarkRunner, BenchmarkRunner, LoginStormBenchmarkRunner, TransferBenchmarkRunner, compare,
+)
+from shop.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main endpoints in process against the configured (seeded) database "
+        "and optionally compare the results with a baseline JSON file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS],
+                            help="Run only the given scenarios, can be repeated.")
+        parser.add_argument('--clear-cache', action='store_true',
+                            help="Clear the cache before every request (bypass it with --asgi).")
+        parser.add_argument('--asgi', action='store_true',
+                            help="Compare the sync and async catalog views under concurrent ASGI clients instead.")
+        parser.add_argument('--clients', type=int, default=1000, help="Concurrent clients with --asgi.")
+        parser.add_argument('--requests-per-client', type=int, default=5)
+        parser.add_argument('--send-delay', type=float, default=0,
+                            help="Milliseconds a client takes to receive each response chunk, with --asgi.")
+        parser.add_argument('--transfer', action='store_true',
+                            help="Measure the throughput and peak memory of the product export and import instead.")
+        parser.add_argument('--import-batch-size', type=int, default=1000)
+        parser.add_argument('--login-storm', type=int, metavar='THREADS',
+                            help="Compare the catalog latency alone and while this many threads keep logging in.")
+        parser.add_argument('--without-middleware', action='append', default=[], metavar='PATH',
+                            help="Leave out this middleware, e.g. core.metrics.MetricsMiddleware, to measure its "
+                                 "overhead against a baseline run with it. Can be repeated.")
+        parser.add_argument('--search-backend',
+                            help="Dotted path of the shop search backend to use instead of the configured one, "
+                                 "e.g. shop.search.BasicSearchBackend.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--baseline', help="JSON results of a previous run to compare with.")
+        parser.add_argument('--threshold', type=float, default=10,
+                            help="Allowed regression against the baseline, in percent.")
+
+    def get_runner(self, options):
+        if options['asgi']:
+            return ASGIBenchmarkRunner(
+                clients=options['clients'],
+                requests_per_client=options['requests_per_client'],
+                send_delay=options['send_delay'] / 1000,
+                clear_cache=options['clear_cache'],
+                stdout=self.stdout,
+            )
+        if options['transfer']:
+            return TransferBenchmarkRunner(batch_size=options['import_batch_size'], stdout=self.stdout)
+        if options['login_storm']:
+            return LoginStormBenchmarkRunner(
+                logins=options['login_storm'],
+                iterations=options['iterations'],
+                clear_cache=options['clear_cache'],
+                stdout=self.stdout,
+            )
+        return BenchmarkRunner(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            scenarios=[
+                scenario for scenario in SCENARIOS
+                if not options['scenario'] or scenario.name in options['scenario']
+            ],
+            clear_cache=options['clear_cache'],
+            stdout=self.stdout,
+        )
+
+    def handle(self, *args, **options):
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            # the throttles would reject a benchmark long before it is done
+            'DEFAULT_THROTTLE_RATES': {
+                scope: '1000000/s' for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+            },
+        }
+        overrides = {}
+        if options['search_backend']:
+            overrides['SHOP_SEARCH_BACKEND'] = options['search_backend']
+        if options['without_middleware']:
+            unknown = set(options['without_middleware']) - set(settings.MIDDLEWARE)
+            if unknown:
+                raise CommandError(f"Not in MIDDLEWARE: {', '.join(sorted(unknown))}.")
+            overrides['MIDDLEWARE'] = [
+                middleware for middleware in settings.MIDDLEWARE if middleware not in options['without_middleware']
+            ]
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], REST_FRAMEWORK=rest_framework,
+                               **overrides):
+            # the handlers load the middleware when they are created
+            runner = self.get_runner(options)
+            try:
+                results = runner.run()
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            results['meta']['search_backend'] = type(get_search_backend()).__name__
+            results['meta']['middleware'] = list(settings.MIDDLEWARE)
+
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(results, stream, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as stream:
+                baseline = json.load(stream)
+            regressions = compare(results, baseline, options['threshold'] / 100)
+            for name, metric, old, new, change in regressions:
+                self.stderr.write(f"{name}: {metric} {old} -> {new} ({change:+.1%})")
+            if regressions:
+                raise CommandError(f"{len(regressions)} metrics regressed by more than {options['threshold']}%.")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import prune_sent_emails, send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails of the outbox, once or continuously with --loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_emails(batch_size=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} emails, {failed} failed."))
+            caught_up = sent + failed < options['batch_size']
+            if caught_up:
+                pruned = prune_sent_emails()
+                if pruned:
+                    self.stdout.write(f"Pruned {pruned} sent emails.")
+            if not options['loop']:
+                break
+            # drain full batches back to back, only sleep once caught up
+            if caught_up:
+                time.sleep(options['interval'])
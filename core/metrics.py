@@ -0,0 +1,280 @@
+import os
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class ViewMetrics:
+    __slots__ = ('buckets', 'count', 'seconds', 'queries', 'sql_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+class Registry:
+    """
+    In-process metrics of the requests handled by this worker, keyed by view
+    and method. Every worker process keeps its own registry, the exposition
+    carries a `pid` label so that they can be told apart.
+    """
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def record(self, view, method, seconds, queries, sql_seconds, serialization_seconds):
+        with self.lock:
+            metrics = self.views.get((view, method))
+            if metrics is None:
+                metrics = self.views[(view, method)] = ViewMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.count += 1
+            metrics.seconds += seconds
+            metrics.queries += queries
+            metrics.sql_seconds += sql_seconds
+            metrics.serialization_seconds += serialization_seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                key: (list(metrics.buckets), metrics.count, metrics.seconds,
+                      metrics.queries, metrics.sql_seconds, metrics.serialization_seconds)
+                for key, metrics in self.views.items()
+            }
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+
+registry = Registry()
+
+# functions of other apps returning [(name, type, help, value)], their values
+# are not per process
+collectors = []
+
+
+def register_collector(collector):
+    collectors.append(collector)
+    return collector
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper() that counts the queries and their time.
+    """
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - start
+            self.queries += 1
+
+
+# the method is chosen by the client, anything else is recorded as OTHER so
+# that the labels (and _view_names) stay bounded
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'])
+OTHER = 'other'
+
+
+def get_method_label(request):
+    return request.method if request.method in HTTP_METHODS else OTHER
+
+
+def get_handler_name(view_class, method):
+    if method not in view_class.http_method_names:
+        return None
+    if hasattr(view_class, method):
+        return method
+    # View.setup() answers HEAD with get()
+    if method == 'head' and hasattr(view_class, 'get'):
+        return method
+    return None
+
+
+_view_names = {}
+
+
+def get_view_name(request):
+    """
+    "ProductViewSet.list" for viewsets, "PermissionListView.get" for other
+    class-based views and the function name otherwise. Methods the view has
+    no handler for are named "<view>.other".
+    """
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+
+    method = get_method_label(request)
+    key = (match.func, method)
+    name = _view_names.get(key)
+    if name is None:
+        view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+        if view_class is None:
+            name = getattr(match.func, '__name__', 'unknown')
+        else:
+            actions = getattr(match.func, 'actions', None) or {}
+            action = actions.get(method.lower()) or get_handler_name(view_class, method.lower()) or OTHER
+            name = f'{view_class.__name__}.{action}'
+        _view_names[key] = name
+    return name
+
+
+class StreamingMetrics:
+    """
+    Wraps the content of a streaming response so that the queries run while
+    it is iterated are recorded too, and the request is recorded once the
+    server closes the response rather than when its headers are ready.
+    """
+    def __init__(self, content, middleware, request, start, recorder):
+        self.iterator = iter(content)
+        self.middleware = middleware
+        self.request = request
+        self.start = start
+        self.recorder = recorder
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.middleware.recording(self.recorder):
+            return next(self.iterator)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.middleware.record(self.request, self.start, self.recorder)
+
+
+class MetricsMiddleware:
+    """
+    Records per view latency, SQL query count and time, and the time spent
+    rendering (serializing) the response. Streaming responses are recorded
+    when they are closed, including the queries run while streaming.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        request._metrics_serialization_seconds = 0.0
+        start = perf_counter()
+
+        with self.recording(recorder):
+            response = self.get_response(request)
+
+        return self.finish(request, response, start, recorder)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        request._metrics_serialization_seconds = 0.0
+        start = perf_counter()
+
+        with self.recording(recorder):
+            response = await self.get_response(request)
+
+        return self.finish(request, response, start, recorder)
+
+    def recording(self, recorder):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    def finish(self, request, response, start, recorder):
+        # async streaming content is consumed on the event loop, where the
+        # query wrappers of the threads running the ORM cannot be installed
+        if response.streaming and not response.is_async:
+            response.streaming_content = StreamingMetrics(response.streaming_content, self, request, start, recorder)
+        else:
+            self.record(request, start, recorder)
+        return response
+
+    def record(self, request, start, recorder):
+        registry.record(
+            get_view_name(request),
+            get_method_label(request),
+            perf_counter() - start,
+            recorder.queries,
+            recorder.seconds,
+            request._metrics_serialization_seconds,
+        )
+
+    def process_template_response(self, request, response):
+        # called right before the response is rendered
+        start = perf_counter()
+
+        def record_serialization(response):
+            request._metrics_serialization_seconds += perf_counter() - start
+
+        response.add_post_render_callback(record_serialization)
+        return response
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    pid = os.getpid()
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by view.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    counters = {
+        'http_request_sql_queries_total': ('SQL queries by view.', 3),
+        'http_request_sql_seconds_total': ('Time spent in SQL by view.', 4),
+        'http_request_serialization_seconds_total': ('Time spent rendering responses by view.', 5),
+    }
+    snapshot = sorted(registry.snapshot().items())
+
+    for (view, method), values in snapshot:
+        buckets, count, seconds = values[:3]
+        labels = f'view="{escape(view)}",method="{method}",pid="{pid}"'
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf', ), buckets):
+            cumulative += bucket
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {seconds}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+
+    for name, (help, index) in counters.items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} counter')
+        for (view, method), values in snapshot:
+            labels = f'view="{escape(view)}",method="{method}",pid="{pid}"'
+            lines.append(f'{name}{{{labels}}} {values[index]}')
+
+    for collector in collectors:
+        for name, metric_type, help, value in collector():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user_claims_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('password_reset', 'Password reset')], max_length=50)),
+                ('to_email', models.EmailField(max_length=255)),
+                ('context', models.JSONField(blank=True, default=dict)),
+                ('dedupe_key', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('last_error', models.TextField(blank=True)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('datetime_sent', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queued_emails', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='core_emailo_status_a125e4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
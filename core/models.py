@@ -1,6 +1,7 @@
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 from django.db import models
 
+from . import hashing
 from .validators import validate_national_number
 
 
@@ -46,16 +47,106 @@ class User(AbstractBaseUser, PermissionsMixin):
         max_length=10,
         validators=[validate_national_number],
     )
+    # bumped whenever the role claims embedded in issued JWTs become stale
+    claims_version = models.PositiveIntegerField(default=0)
 
     objects = UserManager()
     
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
+    # fields stamped on the access tokens, see core.authentication
+    CLAIM_FIELDS = ("email", "is_active", "is_admin", "is_superuser")
 
     def __str__(self):
         return self.email
     
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    async def aset_password(self, raw_password):
+        self.password = await hashing.amake_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            self.save(update_fields=["password"])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
+    async def acheck_password(self, raw_password):
+        async def setter(raw_password):
+            await self.aset_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            await self.asave(update_fields=["password"])
+
+        return await hashing.acheck_password(raw_password, self.password, setter)
+
+    def save(self, *args, **kwargs):
+        # claims_version is only ever incremented in the database (see
+        # core.authentication), never write back the in-memory value
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "claims_version"
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded claims so that changing them can invalidate the tokens
+        loaded_values = dict(zip(field_names, values))
+        instance._loaded_claims = tuple(loaded_values.get(field) for field in cls.CLAIM_FIELDS)
+        return instance
+
+    @property
+    def claims(self):
+        return tuple(getattr(self, field) for field in self.CLAIM_FIELDS)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
-        
\ No newline at end of file
+        
+
+class EmailOutbox(models.Model):
+    KIND_PASSWORD_RESET = "password_reset"
+    KIND_CHOICES = [
+        (KIND_PASSWORD_RESET, "Password reset"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="queued_emails")
+    to_email = models.EmailField(max_length=255)
+    context = models.JSONField(default=dict, blank=True)
+    # held by the latest message of a kind and user, see core.outbox.enqueue_email
+    dedupe_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_sent = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.to_email}"
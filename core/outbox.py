@@ -0,0 +1,154 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .email import PasswordResetEmail
+from .models import EmailOutbox
+
+
+EMAIL_CLASSES = {
+    EmailOutbox.KIND_PASSWORD_RESET: PasswordResetEmail,
+}
+
+
+def get_request_context(request):
+    # the worker has no request, so capture what the templates need from it
+    site = get_current_site(request)
+    return {
+        "domain": getattr(settings, "DOMAIN", "") or site.domain,
+        "protocol": "https" if request.is_secure() else "http",
+        "site_name": getattr(settings, "SITE_NAME", "") or site.name,
+    }
+
+
+def enqueue_email(kind, user, request=None):
+    """
+    Queues an email for the send_queued_emails worker. A request for the
+    same kind and user is collapsed into the latest message while that one
+    is still pending or was queued less than EMAIL_OUTBOX_DEDUPE_WINDOW
+    seconds ago. If sending it failed for good, it is queued again.
+
+    The latest message holds the unique dedupe key, so concurrent requests
+    agree on it. Once it is sent and the window has passed, the key is
+    released for a new message.
+    """
+    now = timezone.now()
+    dedupe_key = f"{kind}:{user.pk}"
+    fields = {
+        "kind": kind,
+        "user": user,
+        "to_email": user.email,
+        "context": get_request_context(request) if request else {},
+        "next_attempt_at": now,
+    }
+    while True:
+        email, created = EmailOutbox.objects.get_or_create(dedupe_key=dedupe_key, defaults=fields)
+        if created or email.status == EmailOutbox.STATUS_PENDING:
+            return email
+        if email.status == EmailOutbox.STATUS_FAILED:
+            EmailOutbox.objects.filter(pk=email.pk, status=EmailOutbox.STATUS_FAILED).update(
+                **fields, status=EmailOutbox.STATUS_PENDING, attempts=0, last_error="", datetime_created=now,
+            )
+            email.refresh_from_db()
+            return email
+        if email.datetime_created > now - timedelta(seconds=settings.EMAIL_OUTBOX_DEDUPE_WINDOW):
+            return email
+        # only one of the concurrent requests releases the key, all of them
+        # then meet on the message created by the first to get there
+        EmailOutbox.objects.filter(pk=email.pk, dedupe_key=dedupe_key).update(dedupe_key=None)
+
+
+def get_retry_delay(attempts):
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def record_failure(email, error):
+    email.last_error = repr(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = EmailOutbox.STATUS_FAILED
+    else:
+        email.next_attempt_at = timezone.now() + get_retry_delay(email.attempts)
+
+
+def claim_queued_emails(batch_size):
+    """
+    Claims a batch of due messages by counting the attempt and pushing
+    next_attempt_at past EMAIL_OUTBOX_CLAIM_TIMEOUT, in a short transaction of
+    its own. Rows are locked with SKIP LOCKED so several workers can claim at
+    the same time, and the messages of a worker that dies while sending are
+    due again once the claim times out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            EmailOutbox.objects
+            .select_for_update(skip_locked=True, of=("self", ))
+            .select_related("user")
+            .filter(status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+        EmailOutbox.objects.bulk_update(emails, ["attempts", "next_attempt_at"])
+    return emails
+
+
+def send_queued_emails(batch_size=100):
+    """
+    Sends one batch of due messages over a single backend connection and
+    returns (sent, failed). The backend is only talked to once the claim is
+    committed, so no database transaction stays open while sending.
+
+    A connection that cannot be opened counts as a failed attempt for the
+    whole batch, and the outcome of every message is saved even when closing
+    the connection fails.
+    """
+    emails = claim_queued_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            for email in emails:
+                failed += 1
+                record_failure(email, e)
+        else:
+            try:
+                for email in emails:
+                    message = EMAIL_CLASSES[email.kind](context={**email.context, "user": email.user})
+                    message.connection = connection
+                    try:
+                        message.send(to=[email.to_email])
+                    except Exception as e:
+                        failed += 1
+                        record_failure(email, e)
+                    else:
+                        sent += 1
+                        email.status = EmailOutbox.STATUS_SENT
+                        email.datetime_sent = timezone.now()
+                        email.last_error = ""
+            finally:
+                connection.close()
+    finally:
+        EmailOutbox.objects.bulk_update(emails, ["status", "next_attempt_at", "last_error", "datetime_sent"])
+    return sent, failed
+
+
+def prune_sent_emails():
+    """
+    Deletes the messages sent more than EMAIL_OUTBOX_RETENTION seconds ago
+    and returns how many. Failed ones are kept for inspection.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION)
+    deleted, _ = EmailOutbox.objects.filter(status=EmailOutbox.STATUS_SENT, datetime_sent__lt=cutoff).delete()
+    return deleted
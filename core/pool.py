@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import DatabaseError
+
+
+class PoolTimeout(DatabaseError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of DB-API connections shared by the threads of a process.
+
+    At most `max_size` connections exist at once, a checkout beyond that
+    waits up to `timeout` seconds for one to be returned. Idle connections
+    older than `max_age` seconds are closed instead of being handed out, and
+    with `health_checks` the others must pass `check` first. Acquiring blocks
+    the calling thread, from async code it runs on the thread Django's
+    sync_to_async() gives the ORM.
+    """
+    def __init__(self, max_size=10, timeout=10, max_age=None, health_checks=True, check=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.health_checks = health_checks
+        self.check = check
+        self.idle = deque()
+        self.created_at = {}
+        self.condition = threading.Condition()
+        self.size = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.recycled = 0
+
+    def is_expired(self, connection):
+        return self.max_age is not None and time.monotonic() - self.created_at[id(connection)] > self.max_age
+
+    def acquire(self, connect):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.condition:
+                connection = self.checkout(deadline)
+            if connection is None:
+                break
+            if self.health_checks and self.check and not self.check(connection):
+                self.discard(connection)
+                continue
+            return connection
+
+        try:
+            connection = connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created_at[id(connection)] = time.monotonic()
+            self.created += 1
+        return connection
+
+    def checkout(self, deadline):
+        """
+        Returns an idle connection, or None after reserving room for a new
+        one. Called with the condition held.
+        """
+        while True:
+            while self.idle:
+                connection = self.idle.pop()
+                if self.is_expired(connection):
+                    self.close(connection)
+                    continue
+                self.in_use += 1
+                return connection
+
+            if self.size < self.max_size:
+                self.size += 1
+                self.in_use += 1
+                return None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolTimeout(f"No database connection available within {self.timeout}s.")
+            self.waiting += 1
+            try:
+                self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def release(self, connection):
+        with self.condition:
+            self.in_use -= 1
+            if self.is_expired(connection):
+                self.close(connection)
+            else:
+                self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection):
+        with self.condition:
+            self.in_use -= 1
+            self.close(connection)
+            self.condition.notify()
+
+    def close(self, connection):
+        # called with the condition held
+        self.size -= 1
+        self.recycled += 1
+        self.created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_idle(self):
+        with self.condition:
+            while self.idle:
+                self.close(self.idle.pop())
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                'created': self.created,
+                'recycled': self.recycled,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, check=None):
+    # keyed by pid so that a forked worker never reuses its parent's sockets
+    key = (os.getpid(), alias)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = settings_dict.get('POOL', {})
+                pool = _pools[key] = ConnectionPool(
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                    max_age=options.get('MAX_AGE'),
+                    health_checks=settings_dict.get('CONN_HEALTH_CHECKS', True),
+                    check=check,
+                )
+    return pool
+
+
+def get_metrics():
+    pools = [pool for (pid, alias), pool in list(_pools.items()) if pid == os.getpid()]
+    totals = {}
+    for pool in pools:
+        for key, value in pool.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return [
+        ('db_pool_connections_in_use', 'gauge', 'Pooled connections checked out.', totals.get('in_use', 0)),
+        ('db_pool_connections_idle', 'gauge', 'Pooled connections waiting for a checkout.', totals.get('idle', 0)),
+        ('db_pool_waiting', 'gauge', 'Threads waiting for a pooled connection.', totals.get('waiting', 0)),
+        ('db_pool_connections_created_total', 'counter', 'Connections opened by the pools.', totals.get('created', 0)),
+        ('db_pool_connections_recycled_total', 'counter', 'Connections closed for age or failed health checks.',
+         totals.get('recycled', 0)),
+    ]
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    DatabaseWrapper mixin that checks connections out of the process pool
+    instead of opening them, and returns them when Django closes them. Since
+    returning is cheap, connections go back to the pool at the end of every
+    request whatever CONN_MAX_AGE is, the pool's MAX_AGE recycles them.
+    """
+    def get_pool(self):
+        return get_pool(self.alias, self.settings_dict, check=self.check_connection)
+
+    def check_connection(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        return self.get_pool().acquire(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = self.get_pool()
+        # Django keeps a connection closed inside atomic() until the block
+        # exits, so it cannot be handed to another thread
+        if self.in_atomic_block or (self.errors_occurred and not self.check_connection(self.connection)):
+            pool.discard(self.connection)
+            return
+        if not self.get_autocommit():
+            try:
+                self.connection.rollback()
+            except Exception:
+                pool.discard(self.connection)
+                return
+        pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        if self.connection is not None and not self.in_atomic_block:
+            self.close()
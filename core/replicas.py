@@ -0,0 +1,155 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+# set for the duration of a request that may read from a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+# set once the request has written, or asked for the primary explicitly
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+def get_replicas():
+    """
+    {alias: weight} of the replicas reads may be sent to.
+    """
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def choose_replica():
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    aliases = list(replicas)
+    return random.choices(aliases, weights=[replicas[alias] for alias in aliases])[0]
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    pinned_token = _pinned.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _replica_reads.reset(token)
+
+
+def pin_to_primary():
+    """
+    Sends the remaining reads of the current request to the primary.
+    """
+    _pinned.set(True)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends the reads of the block to the primary without pinning the rest of
+    the request, for lookups a lagging replica must not answer. Not meant for
+    blocks that write.
+    """
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a replica picked by weight, only inside replica_reads()
+    (see ReplicaMiddleware) and only until the request writes or opens a
+    transaction on the primary. Everything else uses the primary.
+    """
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from where the instance was loaded
+            return instance._state.db
+        if not _replica_reads.get() or _pinned.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get the schema from the primary
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Lets safe-method requests read from the replicas, except for the paths of
+    DATABASE_PRIMARY_PATHS and for clients that wrote within the last
+    DATABASE_STICKY_SECONDS, so users always see their own writes.
+
+    The window is kept client side in a cookie holding its end timestamp,
+    every unsafe request starts a new one.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.can_use_replica(request):
+            response = self.get_response(request)
+        else:
+            with replica_reads():
+                response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        if not self.can_use_replica(request):
+            response = await self.get_response(request)
+        else:
+            with replica_reads():
+                response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            sticky_seconds = settings.DATABASE_STICKY_SECONDS
+            response.set_cookie(
+                settings.DATABASE_STICKY_COOKIE,
+                str(int(time.time() + sticky_seconds)),
+                max_age=sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def can_use_replica(self, request):
+        if not get_replicas() or request.method not in SAFE_METHODS:
+            return False
+        if request.path.startswith(tuple(settings.DATABASE_PRIMARY_PATHS)):
+            return False
+        try:
+            sticky_until = int(request.COOKIES.get(settings.DATABASE_STICKY_COOKIE, 0))
+        except ValueError:
+            sticky_until = 0
+        return sticky_until <= time.time()
@@ -6,10 +6,15 @@ from django.db import IntegrityError
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.settings import api_settings
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import add_user_claims, get_user_instance
 
 from .constants import Messages
+from .groups import get_user_groups
 from .models import User
-from .utils import decode_uid
+from .utils import decode_uid, get_missing_ids
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -88,19 +93,21 @@ class UserAdminUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("groups", )
+
+    def validate_groups(self, value):
+        group_ids = [group['id'] for group in value]
+        missing_ids = get_missing_ids(Group.objects.all(), group_ids)
+        if missing_ids:
+            raise serializers.ValidationError(Messages.INVALID_IDS_ERROR.format(ids=missing_ids))
+        return group_ids
     
     def update(self, instance, validated_data):
-        groups_data = validated_data.get("groups")
+        group_ids = validated_data.get("groups")
 
-        instance.is_admin = bool(groups_data)
+        instance.is_admin = bool(group_ids)
         instance.save()
 
-        groups = [
-            Group.objects.get(
-                id=group['id'],
-            ) for group in groups_data
-        ]
-        instance.groups.set(groups)
+        instance.groups.set(group_ids)
 
         return instance
     
@@ -116,7 +123,7 @@ class UserRetrieveSerializer(serializers.ModelSerializer):
         if instance.is_admin != instance.is_superuser:
             rep['is_admin'] = True
             rep['groups'] = [
-                dict(id=group.id) for group in instance.groups.all()
+                dict(id=group_id) for group_id in sorted(get_user_groups(instance))
             ] 
 
         return rep   
@@ -149,7 +156,7 @@ class CurrentPasswordSerializer(serializers.Serializer):
     )
 
     def validate_current_password(self, value):
-        user = self.context['request'].user
+        user = get_user_instance(self.context['request'])
         is_password_valid = user.check_password(value)
         if is_password_valid:
             return value
@@ -170,7 +177,7 @@ class SetPasswordSerializer(serializers.Serializer):
     re_new_password = serializers.CharField(style={"input_type": "password"})
 
     def validate(self, data):
-        user = getattr(self, "user", None) or self.context["request"].user
+        user = getattr(self, "user", None) or get_user_instance(self.context["request"])
         # why assert? There are ValidationError / fail everywhere
         assert user is not None
         new_password = data["new_password"]
@@ -269,4 +276,23 @@ class UsernameSerializer(serializers.ModelSerializer):
 class UserChangeUsernameSerializer(CurrentPasswordSerializer, UsernameSerializer):
     class Meta(UsernameSerializer.Meta):
         fields = (User.USERNAME_FIELD, "current_password")
-        
\ No newline at end of file
+        
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    def validate(self, attrs):
+        data = super().validate(attrs)
+
+        # stamp the current roles on the new access token instead of copying
+        # the (possibly stale) claims of the refresh token
+        refresh = self.token_class(data.get("refresh", attrs["refresh"]), verify=False)
+        user = User.objects.get(
+            **{jwt_settings.USER_ID_FIELD: refresh[jwt_settings.USER_ID_CLAIM]}
+        )
+        data["access"] = str(add_user_claims(refresh.access_token, user))
+        return data
@@ -1,7 +1,10 @@
 from django.contrib.auth.models import Group
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from core.authentication import bump_claims_version, claims_version_key, memberships_changed
+from core.groups import invalidate_user_groups
 from core.models import User
 
 
@@ -10,3 +13,41 @@ def add_superuser_to_created_group(sender, instance, created, **kwargs):
     if created:
         superusers = User.objects.filter(is_superuser=True)
         instance.user_set.add(*superusers)      
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_changed_group_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            memberships_changed([instance.pk])
+    elif action == 'pre_clear':
+        # the members are gone by post_clear, so remember them now
+        instance._cleared_user_ids = list(instance.user_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        memberships_changed(getattr(instance, '_cleared_user_ids', []))
+    elif action in ['post_add', 'post_remove']:
+        memberships_changed(pk_set)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_renamed_group_memberships(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_groups(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_deleted_group_memberships(sender, instance, **kwargs):
+    memberships_changed(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_changed_user_claims(sender, instance, created, **kwargs):
+    loaded_claims = getattr(instance, '_loaded_claims', None)
+    if not created and loaded_claims is not None and loaded_claims != instance.claims:
+        bump_claims_version([instance.pk])
+    instance._loaded_claims = instance.claims
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_claims(sender, instance, **kwargs):
+    cache.delete(claims_version_key(instance.pk))
@@ -0,0 +1,178 @@
+import difflib
+import re
+import threading
+from time import perf_counter
+from unittest import SkipTest, skipUnless
+
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+
+NORMALIZE_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), "'?'"),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'IN \((?:\?, )*\?\)'), 'IN (...)'),
+]
+
+
+def normalize_sql(sql):
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def summarize_queries(queries):
+    """
+    Collapses repeated queries into one "N x query" line, an N+1 shows up as
+    a single line with a count that grows with the data.
+    """
+    counts = {}
+    for query in queries:
+        counts[query] = counts.get(query, 0) + 1
+    return [f"{count} x {query}" if count > 1 else query for query, count in counts.items()]
+
+
+# plan steps of SQLite's EXPLAIN QUERY PLAN that read a whole table or sort
+# the rows outside of an index
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+TEMP_SORT_RE = re.compile(r'^USE TEMP B-TREE FOR ')
+
+
+def explain_query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[3] for row in cursor.fetchall()]
+
+
+def run_concurrently(function, threads=8):
+    """
+    Calls function(index) from `threads` threads released at the same time
+    and returns (results, exceptions, seconds). Needs a TransactionTestCase,
+    the other threads do not see the data of a TestCase transaction.
+    """
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        # shared-cache tables are locked, not waited for, across connections
+        raise SkipTest("Concurrent writes need a database file, set DB_TEST_NAME.")
+    barrier = threading.Barrier(threads)
+    results, exceptions = [], []
+
+    def target(index):
+        try:
+            barrier.wait()
+            results.append(function(index))
+        except Exception as e:
+            exceptions.append(e)
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=target, args=(index, )) for index in range(threads)]
+    started = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results, exceptions, perf_counter() - started
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that calls every endpoint of `budgets` ({url: max
+    queries}) once the fixtures are seeded at each of `sizes`, and fails when
+    an endpoint needs more queries than its budget or more queries at a
+    larger size. Subclasses implement seed(size), which grows the fixtures to
+    `size` rows.
+
+    Failures list the offending queries, as a diff against the smallest size
+    when the count grew with the data.
+    """
+    sizes = (10, 1000)
+    budgets = {}
+
+    def seed(self, size):
+        raise NotImplementedError
+
+    def get_budgets(self):
+        return self.budgets
+
+    def get_client(self):
+        return APIClient()
+
+    def capture(self, client, url):
+        # measure the uncached path
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertLess(response.status_code, 400, f"GET {url} returned {response.status_code}")
+        return [normalize_sql(query['sql']) for query in context.captured_queries]
+
+    def test_query_budgets(self):
+        client = self.get_client()
+        baseline = {}
+
+        for size in self.sizes:
+            self.seed(size)
+            for url, budget in self.get_budgets().items():
+                queries = self.capture(client, url)
+                with self.subTest(url=url, size=size):
+                    if len(queries) > budget:
+                        self.fail(
+                            f"GET {url} with {size} rows ran {len(queries)} queries, "
+                            f"budget is {budget}:\n" + "\n".join(summarize_queries(queries))
+                        )
+                    if url in baseline and len(queries) > len(baseline[url]):
+                        diff = difflib.unified_diff(
+                            summarize_queries(baseline[url]), summarize_queries(queries),
+                            fromfile=f"{self.sizes[0]} rows", tofile=f"{size} rows", lineterm="",
+                        )
+                        self.fail(
+                            f"GET {url} ran {len(queries)} queries with {size} rows and "
+                            f"{len(baseline[url])} with {self.sizes[0]} rows:\n" + "\n".join(diff)
+                        )
+                baseline.setdefault(url, queries)
+
+
+class QueryPlanMixin:
+    """
+    TestCase mixin that runs EXPLAIN QUERY PLAN (SQLite only) for every query
+    of the endpoints in `query_plans` ({url: allowed steps}) and fails when a
+    query scans a whole table or sorts without an index, unless the plan step
+    ("SCAN shop_category", "USE TEMP B-TREE FOR ORDER BY") is allowed for the
+    url.
+
+    Without ANALYZE statistics the planner assumes large tables, so the plans
+    do not depend on the size of the fixtures.
+    """
+    query_plans = {}
+
+    def get_query_plans(self):
+        return self.query_plans
+
+    def get_client(self):
+        return APIClient()
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_query_plans(self):
+        client = self.get_client()
+
+        for url, allowed in self.get_query_plans().items():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            self.assertLess(response.status_code, 400, f"GET {url} returned {response.status_code}")
+
+            for query in context.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                plan = explain_query_plan(query['sql'])
+                offending = [
+                    step for step in plan
+                    if (FULL_SCAN_RE.match(step) or TEMP_SORT_RE.match(step)) and step not in allowed
+                ]
+                with self.subTest(url=url):
+                    if offending:
+                        self.fail(
+                            f"GET {url} ran a query without a usable index ({', '.join(offending)}):\n"
+                            f"{query['sql']}\n" + "\n".join(plan)
+                        )
@@ -1,3 +1,617 @@
-from django.test import TestCase
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from shop.models import Cart, Category, Order, Product
+
+from . import hashing, metrics
+from .authentication import ClaimsJWTAuthentication, get_claims_version
+from .benchmark import SCENARIOS, BenchmarkRunner, compare
+from .email import PasswordResetEmail
+from .groups import get_user_groups, is_in_group
+from .hashing import HashingPool, HashingUnavailable
+from .metrics import registry
+from .models import EmailOutbox, User
+from .outbox import claim_queued_emails, enqueue_email, prune_sent_emails, send_queued_emails
+from .pool import ConnectionPool, PoolTimeout
+from .replicas import ReplicaMiddleware, ReplicaRouter, replica_reads
+from .serializers import TokenObtainPairSerializer
+from .testing import QueryBudgetMixin
+from .throttling import LoadSheddingMixin, TokenBucketThrottle, _in_flight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock()
+        self.request = APIView().initialize_request(APIRequestFactory().get("/"))
+
+    def make_throttle(self, rate):
+        throttle_class = type("TestThrottle", (TokenBucketThrottle, ), {"scope": "test", "rate": rate})
+        throttle = throttle_class()
+        throttle.timer = self.clock
+        return throttle
+
+    def test_allows_a_burst_then_refills_at_the_rate(self):
+        throttle = self.make_throttle("3/min")
+        self.assertEqual([throttle.allow_request(self.request, None) for _ in range(4)], [True] * 3 + [False])
+        self.assertAlmostEqual(throttle.wait(), 20)
+
+        self.clock.now += 20
+        self.assertTrue(throttle.allow_request(self.request, None))
+        self.assertFalse(throttle.allow_request(self.request, None))
+
+    def test_contended_bucket_is_throttled_until_the_lock_expires(self):
+        throttle = self.make_throttle("3/min")
+        cache.add(f"{throttle.get_cache_key(self.request, None)}:lock", 1)
+        self.assertFalse(throttle.allow_request(self.request, None))
+        self.assertEqual(throttle.wait(), throttle.lock_timeout)
+
+
+class AuthThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    @override_settings(REST_FRAMEWORK={
+        'DEFAULT_AUTHENTICATION_CLASSES': ('core.authentication.ClaimsJWTAuthentication', ),
+        'DEFAULT_THROTTLE_RATES': {'login': '2/min'},
+    })
+    def test_login_is_throttled_per_ip(self):
+        statuses = [
+            self.client.post("/auth/jwt/create/", {"email": "a@example.com", "password": "x"}).status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [401, 401, 429])
+
+    @override_settings(AUTH_MAX_IN_FLIGHT=0)
+    def test_load_shedding_rejects_with_retry_after(self):
+        response = self.client.post("/auth/jwt/create/", {"email": "a@example.com", "password": "x"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertFalse(any(_in_flight.values()))
+
+    def test_load_shedding_slot_is_released_when_the_view_raises(self):
+        class FailingView(LoadSheddingMixin, APIView):
+            max_in_flight = 1
+
+            def get(self, request):
+                raise RuntimeError("boom")
+
+        view = FailingView.as_view()
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                view(APIRequestFactory().get("/"))
+        self.assertFalse(any(_in_flight.values()))
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pool = HashingPool(max_workers=1, max_pending=1, retry_after=7)
+        self.addCleanup(lambda: self.pool.executor and self.pool.executor.shutdown())
+
+    def test_runs_on_the_pool_threads(self):
+        self.assertEqual(self.pool.run(lambda: threading.current_thread().name), "password-hashing_0")
+        self.assertEqual(
+            asyncio.run(self.pool.arun(lambda: threading.current_thread().name)), "password-hashing_0",
+        )
+
+    def test_async_hashing(self):
+        with mock.patch("core.hashing._pool", self.pool):
+            encoded = asyncio.run(hashing.amake_password("password"))
+            self.assertTrue(asyncio.run(hashing.acheck_password("password", encoded)))
+            self.assertFalse(asyncio.run(hashing.acheck_password("wrong", encoded)))
+        # the slots are released by the pool threads once they are done
+        self.pool.executor.shutdown()
+        self.assertTrue(self.pool.slots.acquire(blocking=False) and self.pool.slots.acquire(blocking=False))
+
+    def test_full_pool_fails_fast(self):
+        self.pool.slots.acquire()
+        self.pool.slots.acquire()
+        with self.assertRaises(HashingUnavailable):
+            self.pool.run(threading.get_ident)
+        self.pool.slots.release()
+        self.pool.run(threading.get_ident)
+
+    def test_full_pool_is_answered_with_retry_after(self):
+        self.pool.slots.acquire()
+        self.pool.slots.acquire()
+        with mock.patch("core.hashing._pool", self.pool):
+            response = APIClient().post("/auth/jwt/create/", {"email": "a@example.com", "password": "x"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertFalse(any(_in_flight.values()))
+
+    def test_management_code_sees_the_domain_exception(self):
+        self.pool.slots.acquire()
+        self.pool.slots.acquire()
+        with mock.patch("core.hashing._pool", self.pool), self.assertRaises(HashingUnavailable):
+            User.objects.create_user(email="a@example.com", password="password")
+
+
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(email="customer@example.com", password="password"))
+
+    def test_records_queries_and_latency_by_view(self):
+        self.client.get("/shop/categories/")
+        buckets, count, seconds, queries, *_ = registry.snapshot()[("CategoryViewSet.list", "GET")]
+        self.assertEqual((count, sum(buckets)), (1, 1))
+        self.assertGreater(queries, 0)
+
+    def test_streaming_responses_are_recorded_once_closed(self):
+        response = self.client.get("/shop/products/export/csv/")
+        self.assertNotIn(("ProductViewSet.export", "GET"), registry.snapshot())
+        # the test client closes the response once it has been consumed
+        b"".join(response.streaming_content)
+        _, count, _, queries, *_ = registry.snapshot()[("ProductViewSet.export", "GET")]
+        # the products are only read while the body is streamed
+        self.assertEqual(count, 1)
+        self.assertGreater(queries, 0)
+
+    def test_unknown_methods_and_actions_are_bucketed(self):
+        for method in ["FOO", "BAR", "PUT", "OPTIONS"]:
+            self.client.generic(method, "/shop/categories/")
+        view_names = len(metrics._view_names)
+        self.client.generic("BAZ", "/shop/categories/")
+        self.assertEqual(len(metrics._view_names), view_names)
+
+        counts = {key: values[1] for key, values in registry.snapshot().items()}
+        self.assertEqual(counts, {
+            ("CategoryViewSet.other", "other"): 3,
+            # the list route has no action for PUT
+            ("CategoryViewSet.other", "PUT"): 1,
+            ("CategoryViewSet.options", "OPTIONS"): 1,
+        })
+
+
+class BenchmarkCompareTests(TestCase):
+    def test_reports_metrics_worse_than_the_threshold(self):
+        baseline = {"scenarios": {"product_list": {"p95_ms": 10, "requests_per_second": 100, "queries_per_request": 2}}}
+        results = {"scenarios": {
+            "product_list": {"p95_ms": 10.5, "requests_per_second": 80, "queries_per_request": 3},
+            "new_scenario": {"p95_ms": 50},
+        }}
+        self.assertEqual(
+            [(name, metric) for name, metric, *_ in compare(results, baseline, 0.1)],
+            [("product_list", "requests_per_second"), ("product_list", "queries_per_request")],
+        )
+
+
+class BenchmarkCheckoutTests(TransactionTestCase):
+    def setUp(self):
+        # the logins of the runner would otherwise meet the throttles of earlier tests
+        cache.clear()
+
+    def test_checkout_leaves_the_database_as_it_was(self):
+        category = Category.objects.create(title="Category")
+        product = Product.objects.create(
+            name="Lamp", category=category, slug="lamp", description="Description", price=10, inventory=0,
+        )
+        modified = product.datetime_modified
+        scenario = next(scenario for scenario in SCENARIOS if scenario.name == "checkout")
+
+        results = BenchmarkRunner(iterations=20, warmup=5, scenarios=[scenario]).run()
+
+        checkout = results["scenarios"]["checkout"]
+        self.assertEqual((checkout["iterations"], checkout["errors"]), (4, 0))
+        product.refresh_from_db()
+        self.assertEqual((product.inventory, product.datetime_modified), (0, modified))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Cart.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS={"replica": 1})
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, request, write=False):
+        def get_response(request):
+            if write:
+                self.router.db_for_write(User)
+            request.read_from = self.router.db_for_read(User)
+            return HttpResponse()
+
+        response = ReplicaMiddleware(get_response)(request)
+        return request.read_from, response
+
+    def test_safe_requests_read_from_the_replica(self):
+        self.assertEqual(self.route(self.factory.get("/shop/products/"))[0], "replica")
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_writes_stick_to_the_primary(self):
+        read_from, response = self.route(self.factory.post("/shop/carts/"), write=True)
+        self.assertEqual(read_from, "default")
+
+        request = self.factory.get("/shop/products/")
+        request.COOKIES = {key: morsel.value for key, morsel in response.cookies.items()}
+        self.assertEqual(self.route(request)[0], "default")
+
+    def test_reads_after_a_write_in_the_same_request_use_the_primary(self):
+        self.assertEqual(self.route(self.factory.get("/shop/products/"), write=True)[0], "default")
+
+    def test_auth_reads_from_the_primary(self):
+        self.assertEqual(self.route(self.factory.get("/auth/users/me/"))[0], "default")
+
+
+class ReplicaDatabaseTests(TransactionTestCase):
+    """
+    Two replicas in SQLite files of their own, holding data that differs from
+    the primary the way a lagging replica's would.
+    """
+    replicas = {"replica_1": 3, "replica_2": 1}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # declared here rather than on the class, the test runner would set up
+        # test databases for them, but still flushed after every test
+        cls.databases = {"default", *cls.replicas}
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in cls.replicas:
+            connections.settings[alias] = connections.configure_settings({
+                "default": {},
+                alias: {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(cls.directory.name, alias)},
+            })[alias]
+            with connections[alias].schema_editor() as editor:
+                for model in [ContentType, Permission, Group, User, Category, Product]:
+                    editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        del cls.databases
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        replica_settings = override_settings(DATABASE_REPLICAS=self.replicas)
+        replica_settings.enable()
+        self.addCleanup(replica_settings.disable)
+        self.user = User.objects.create_user(email="customer@example.com", password="password")
+        self.group = Group.objects.create(name="Product Management")
+        self.user.groups.add(self.group)
+        # the replicas have not seen the membership, nor the claims version it bumped
+        User.objects.filter(pk=self.user.pk).update(claims_version=5)
+        # rows arrive on the replicas through replication, not through the signals
+        for alias in self.replicas:
+            User.objects.using(alias).bulk_create([
+                User(id=self.user.id, email=self.user.email, password=self.user.password),
+            ])
+            [category] = Category.objects.using(alias).bulk_create([Category(title=alias)])
+            Product.objects.using(alias).bulk_create([
+                Product(name=alias, category=category, slug=alias, description="Description", price=10, inventory=1),
+            ])
+
+    def test_reads_are_spread_by_weight(self):
+        with replica_reads(), mock.patch("core.replicas.random", random.Random(0)):
+            reads = Counter(Product.objects.get().name for _ in range(400))
+        self.assertEqual(set(reads), set(self.replicas))
+        self.assertAlmostEqual(reads["replica_1"] / 400, 0.75, delta=0.07)
+        # only the primary outside a request that may use the replicas
+        self.assertFalse(Product.objects.exists())
+
+    def test_auth_lookups_use_the_primary(self):
+        with replica_reads():
+            self.assertEqual(get_claims_version(self.user.id), 5)
+            self.assertEqual(get_user_groups(self.user), {self.group.id: self.group.name})
+            # a token without a claims version loads the user
+            user = ClaimsJWTAuthentication().get_user(AccessToken.for_user(self.user))
+            self.assertEqual(user._state.db, "default")
+            # without pinning the rest of the request
+            self.assertIn(Product.objects.get().name, self.replicas)
+
+    def test_requests_authenticate_against_the_primary(self):
+        client = APIClient()
+        response = client.post("/auth/jwt/create/", {"email": self.user.email, "password": "password"})
+        client.credentials(HTTP_AUTHORIZATION=f"JWT {response.json()['access']}")
+        # neither the sticky cookie of the login nor an active user on the replicas
+        client.cookies.clear()
+        for alias in self.replicas:
+            User.objects.using(alias).update(is_active=False)
+
+        response = client.get("/shop/products/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response.json()["results"][0]["name"], self.replicas)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.usable = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_reuses_returned_connections_up_to_max_size(self):
+        pool = ConnectionPool(max_size=2, timeout=0.01)
+        first, second = pool.acquire(FakeConnection), pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection), first)
+        self.assertEqual(pool.stats(), {"size": 2, "in_use": 2, "idle": 0, "waiting": 0, "created": 2, "recycled": 0})
+
+    def test_recycles_expired_and_unhealthy_connections(self):
+        pool = ConnectionPool(max_size=2, max_age=0, check=lambda connection: connection.usable)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+
+        pool.max_age = None
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        connection.usable = False
+        self.assertIsNot(pool.acquire(FakeConnection), connection)
+        self.assertEqual(pool.stats()["recycled"], 2)
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser(email="root@example.com", password="password")
+        cls.admin = User.objects.create_user(email="admin@example.com", password="password", is_admin=True)
+        cls.groups = Group.objects.bulk_create([Group(name=f"group-{i}") for i in range(3)])
+        cls.admin.groups.set(cls.groups)
+
+    def get_client(self):
+        client = super().get_client()
+        client.force_authenticate(self.superuser)
+        return client
+
+    def get_budgets(self):
+        return {
+            "/auth/users/": 2,
+            f"/auth/users/{self.admin.id}/": 2,
+            "/auth/users/me/": 1,
+        }
+
+    def seed(self, size):
+        start = User.objects.count()
+        users = User.objects.bulk_create(
+            [User(email=f"user-{i}@example.com", is_admin=True) for i in range(start, size)]
+        )
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user=user, group=group)
+            for user in users
+            for group in self.groups
+        ])
+
+
+class GroupMembershipCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="manager@example.com", password="password")
+        cls.group = Group.objects.create(name="Product Management")
+        cls.user.groups.add(cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_membership_check_runs_no_query(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(is_in_group(self.user, "Product Management"))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_in_group(self.user, "Product Management"))
+            self.assertFalse(is_in_group(self.user, "Support"))
+
+    def test_membership_changes_invalidate_the_cache(self):
+        self.assertTrue(is_in_group(self.user, "Product Management"))
+        self.user.groups.remove(self.group)
+        self.assertFalse(is_in_group(self.user, "Product Management"))
+        self.group.user_set.add(self.user)
+        self.assertTrue(is_in_group(self.user, "Product Management"))
+
+    @override_settings(AUTH_CACHE_TIMEOUT=60)
+    def test_memberships_expire(self):
+        is_in_group(self.user, "Product Management")
+        # an invalidation made by another process with a process-local cache
+        User.groups.through.objects.filter(user=self.user).delete()
+        self.assertTrue(is_in_group(self.user, "Product Management"))
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertFalse(is_in_group(self.user, "Product Management"))
+
+
+class ClaimsAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(email="root@example.com", password="password")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"JWT {self.get_token()}")
+
+    def get_token(self):
+        return TokenObtainPairSerializer.get_token(User.objects.get(pk=self.user.pk)).access_token
+
+    def test_revoked_role_is_rejected_with_an_old_token(self):
+        self.assertEqual(self.client.get("/admin/permissions/").status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_superuser = False
+        user.save()
+        self.assertEqual(self.client.get("/admin/permissions/").status_code, 403)
+
+    def test_deactivated_user_is_rejected_with_an_old_token(self):
+        self.assertEqual(self.client.get("/auth/users/me/").status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get("/auth/users/me/").status_code, 401)
+
+    def test_changing_the_username_invalidates_the_claims(self):
+        response = self.client.post(
+            f"/auth/users/change_{User.USERNAME_FIELD}/",
+            {f"new_{User.USERNAME_FIELD}": "new-root@example.com", "current_password": "password"},
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(User.objects.get(pk=self.user.pk).claims_version, self.user.claims_version + 1)
+        self.assertEqual(self.client.get("/auth/users/me/").json()["email"], "new-root@example.com")
+
+    @override_settings(AUTH_CACHE_TIMEOUT=60)
+    def test_claims_versions_expire(self):
+        self.client.get("/admin/permissions/")
+        # a bump made by another process with a process-local cache
+        User.objects.filter(pk=self.user.pk).update(is_superuser=False, claims_version=F("claims_version") + 1)
+        self.assertEqual(self.client.get("/admin/permissions/").status_code, 200)
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertEqual(self.client.get("/admin/permissions/").status_code, 403)
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_MAX_RETRY_DELAY=90)
+class EmailOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="customer@example.com", password="password")
+
+    def enqueue(self):
+        return enqueue_email(EmailOutbox.KIND_PASSWORD_RESET, self.user)
+
+    def make_due(self):
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+
+    def test_sends_through_the_configured_backend(self):
+        self.enqueue()
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual([message.to for message in mail.outbox], [["customer@example.com"]])
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.STATUS_SENT, 1))
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+    def test_repeated_requests_are_collapsed(self):
+        self.assertEqual(self.enqueue().pk, self.enqueue().pk)
+        send_queued_emails()
+        self.enqueue()
+        self.assertEqual(send_queued_emails(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failures_are_retried_with_backoff(self):
+        self.enqueue()
+        with mock.patch.object(PasswordResetEmail, "send", side_effect=OSError("down")):
+            # doubled after every attempt, up to EMAIL_OUTBOX_MAX_RETRY_DELAY
+            for delay in [60, 90]:
+                self.make_due()
+                started = timezone.now()
+                self.assertEqual(send_queued_emails(), (0, 1))
+                waited = EmailOutbox.objects.get().next_attempt_at - started
+                self.assertAlmostEqual(waited.total_seconds(), delay, delta=5)
+            self.make_due()
+            self.assertEqual(send_queued_emails(), (0, 1))
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.STATUS_FAILED, 3))
+        self.assertIn("down", email.last_error)
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+    def test_requests_are_collapsed_within_a_sliding_window(self):
+        email = self.enqueue()
+        send_queued_emails()
+        window = timedelta(seconds=settings.EMAIL_OUTBOX_DEDUPE_WINDOW)
+        # no matter where the window boundaries of a clock fall
+        EmailOutbox.objects.update(datetime_created=timezone.now() - window + timedelta(seconds=10))
+        self.assertEqual(self.enqueue().pk, email.pk)
+
+        EmailOutbox.objects.update(datetime_created=timezone.now() - window - timedelta(seconds=1))
+        new_email = self.enqueue()
+        self.assertNotEqual(new_email.pk, email.pk)
+        self.assertEqual(self.enqueue().pk, new_email.pk)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.dedupe_key), (EmailOutbox.STATUS_SENT, None))
+        self.assertEqual(send_queued_emails(), (1, 0))
+
+    def test_pending_email_is_never_duplicated(self):
+        email = self.enqueue()
+        window = timedelta(seconds=settings.EMAIL_OUTBOX_DEDUPE_WINDOW)
+        EmailOutbox.objects.update(datetime_created=timezone.now() - window * 2)
+        self.assertEqual(self.enqueue().pk, email.pk)
+
+    def test_connection_failure_fails_the_batch(self):
+        self.enqueue()
+        EmailOutbox.objects.create(
+            kind=EmailOutbox.KIND_PASSWORD_RESET, user=self.user, to_email=self.user.email,
+            next_attempt_at=timezone.now(),
+        )
+        connection = mock.Mock(**{"open.side_effect": OSError("refused")})
+        with mock.patch("core.outbox.get_connection", return_value=connection):
+            self.assertEqual(send_queued_emails(), (0, 2))
+        for email in EmailOutbox.objects.all():
+            self.assertEqual((email.status, email.attempts), (EmailOutbox.STATUS_PENDING, 1))
+            self.assertIn("refused", email.last_error)
+            self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertEqual(mail.outbox, [])
+
+    def test_sent_emails_are_recorded_when_closing_fails(self):
+        self.enqueue()
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.close", side_effect=OSError("reset")):
+            with self.assertRaises(OSError):
+                send_queued_emails()
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_email_can_be_requested_again(self):
+        self.enqueue()
+        with mock.patch.object(PasswordResetEmail, "send", side_effect=OSError("down")):
+            for _ in range(3):
+                self.make_due()
+                send_queued_emails()
+        self.assertEqual(self.enqueue().status, EmailOutbox.STATUS_PENDING)
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertEqual(EmailOutbox.objects.get().attempts, 1)
+
+    def test_claimed_emails_are_not_sent_twice(self):
+        self.enqueue()
+        claimed = claim_queued_emails(batch_size=10)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claim_queued_emails(batch_size=10), [])
+        # the worker died, the claim times out
+        self.make_due()
+        self.assertEqual(send_queued_emails(), (1, 0))
+
+    @override_settings(EMAIL_OUTBOX_RETENTION=60)
+    def test_sent_emails_are_pruned(self):
+        self.enqueue()
+        send_queued_emails()
+        self.assertEqual(prune_sent_emails(), 0)
+        EmailOutbox.objects.update(datetime_sent=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(prune_sent_emails(), 1)
+        self.assertFalse(EmailOutbox.objects.exists())
@@ -0,0 +1,172 @@
+import threading
+import time
+
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket stored in the shared cache. A rate of "10/min" is a bucket of
+    10 tokens refilled at 10 tokens per minute, so short bursts are allowed
+    while the long-term rate is capped.
+
+    The read-modify-write of a bucket is serialized with a cache.add() lock,
+    which is atomic on every cache backend. A request that cannot get the
+    lock within `lock_attempts` tries is throttled rather than let through
+    unchecked: contention on one bucket is itself a burst of that client, and
+    an unlocked update could lose the debits of the concurrent requests. Such
+    a request is asked to retry after `lock_timeout`, the longest a lock
+    (even one left behind by a crashed worker) can be held.
+    """
+    cache = default_cache
+    cache_format = 'throttle:{scope}:{ident}'
+    lock_timeout = 1
+    lock_attempts = 3
+    lock_retry_delay = 0.005
+    scope = None
+    rate = None
+    timer = time.time
+
+    def __init__(self, scope=None):
+        if scope is not None:
+            self.scope = scope
+        self.capacity, self.refill_rate = self.parse_rate(self.get_rate())
+        self.wait_seconds = None
+
+    def get_rate(self):
+        if self.rate is not None:
+            return self.rate
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+
+    def parse_rate(self, rate):
+        num, period = rate.split('/')
+        num = int(num)
+        seconds = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return num, num / seconds
+
+    def get_ident_key(self, request, view):
+        """
+        The client a bucket belongs to, the user when authenticated and the
+        IP address otherwise.
+        """
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.id}'
+        return f'ip:{self.get_ident(request)}'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format.format(scope=self.scope, ident=self.get_ident_key(request, view))
+
+    def allow_request(self, request, view):
+        key = self.get_cache_key(request, view)
+        lock_key = f'{key}:lock'
+
+        for _ in range(self.lock_attempts):
+            if self.cache.add(lock_key, 1, timeout=self.lock_timeout):
+                break
+            time.sleep(self.lock_retry_delay)
+        else:
+            self.wait_seconds = self.lock_timeout
+            return False
+
+        try:
+            now = self.timer()
+            tokens, updated_at = self.cache.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+                self.wait_seconds = None
+            else:
+                self.wait_seconds = (1 - tokens) / self.refill_rate
+            # an untouched bucket is full again after this long
+            timeout = int((self.capacity - tokens) / self.refill_rate) + 1
+            self.cache.set(key, (tokens, now), timeout=timeout)
+        finally:
+            self.cache.delete(lock_key)
+
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    def get_ident_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    pass
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("The service is overloaded, try again later.")
+    default_code = "service_overloaded"
+
+    def __init__(self, wait=None, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+class LoadSheddingMixin:
+    """
+    Rejects requests once `max_in_flight` requests of the same scope are
+    already being handled by this process, before any work is done for them.
+    Rejected requests get `load_shedding_status` (503 or 429) with a
+    Retry-After of `load_shedding_retry_after` seconds.
+    """
+    max_in_flight = None
+    load_shedding_scope = None
+    load_shedding_status = status.HTTP_503_SERVICE_UNAVAILABLE
+    load_shedding_retry_after = 1
+
+    def get_max_in_flight(self):
+        return self.max_in_flight
+
+    def get_load_shedding_scope(self):
+        return self.load_shedding_scope or type(self).__name__
+
+    def dispatch(self, request, *args, **kwargs):
+        self._load_shedding_slot = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # also reached when the exception handler re-raises
+            self.release_load_shedding_slot()
+
+    def initial(self, request, *args, **kwargs):
+        max_in_flight = self.get_max_in_flight()
+        if max_in_flight is not None:
+            scope = self.get_load_shedding_scope()
+            with _in_flight_lock:
+                if _in_flight.get(scope, 0) >= max_in_flight:
+                    self.shed_load()
+                _in_flight[scope] = _in_flight.get(scope, 0) + 1
+            self._load_shedding_slot = scope
+        super().initial(request, *args, **kwargs)
+
+    def release_load_shedding_slot(self):
+        scope = self._load_shedding_slot
+        if scope is not None:
+            self._load_shedding_slot = None
+            with _in_flight_lock:
+                _in_flight[scope] -= 1
+
+    def shed_load(self):
+        if self.load_shedding_status == status.HTTP_429_TOO_MANY_REQUESTS:
+            raise Throttled(wait=self.load_shedding_retry_after)
+        raise ServiceOverloaded(wait=self.load_shedding_retry_after)
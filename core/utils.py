@@ -8,3 +8,12 @@ def encode_uid(pk):
 
 def decode_uid(pk):
     return force_str(urlsafe_base64_decode(pk))
+
+
+def get_missing_ids(queryset, ids):
+    """
+    Returns the sorted ids that are not in the queryset, checking all of them
+    with a single query.
+    """
+    found = queryset.only('pk').in_bulk(ids)
+    return sorted(set(ids) - found.keys())
@@ -1,11 +1,19 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from rest_framework_simplejwt import views as jwt_views
 
-from .email import PasswordResetEmail
-from .models import User
+from .authentication import get_user_instance
+from .hashing import HashingUnavailable
+from .metrics import render_prometheus
+from .models import EmailOutbox, User
+from .outbox import enqueue_email
 from .permissions import IsSuperUser, IsNotAuthenticated
 from .serializers import (
      UserChangePasswordSerializer,
@@ -19,9 +27,31 @@ from .serializers import (
      UserAdminUpdateSerializer,
      UserUpdateSerializer,
 )
+from .throttling import IPTokenBucketThrottle, LoadSheddingMixin, ServiceOverloaded, UserTokenBucketThrottle
 
 
-class UserViewSet(ModelViewSet):
+class PasswordHashingMixin:
+    """
+    Answers a full password hashing pool (see core.hashing) with a 503 and
+    its Retry-After.
+    """
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingUnavailable):
+            exc = ServiceOverloaded(
+                wait=exc.retry_after,
+                detail=_("Too many password operations in progress, try again later."),
+                code="hashing_unavailable",
+            )
+        return super().handle_exception(exc)
+
+
+class UserViewSet(PasswordHashingMixin, LoadSheddingMixin, ModelViewSet):
+    def get_max_in_flight(self):
+        # the actions that hash passwords or send emails
+        if self.action in ['create', 'change_password', 'reset_password', 'reset_password_confirm']:
+            return settings.AUTH_MAX_IN_FLIGHT
+        return None
+
     def get_queryset(self):
         queryset = User.objects.prefetch_related("groups")
         if self.action == 'list':
@@ -36,6 +66,15 @@ class UserViewSet(ModelViewSet):
         if self.action in ['me', 'change_password', 'change_username']:
             return [IsAuthenticated(), ]
         return super().get_permissions()
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [IPTokenBucketThrottle('signup'), ]
+        if self.action in ['reset_password', 'reset_password_confirm']:
+            return [IPTokenBucketThrottle('password_reset'), ]
+        if self.action in ['change_password', 'change_username']:
+            return [UserTokenBucketThrottle('password'), ]
+        return super().get_throttles()
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -74,7 +113,7 @@ class UserViewSet(ModelViewSet):
 
     @action(detail=False, methods=['GET', 'PUT', 'PATCH', 'DELETE'])
     def me(self, request, *args, **kwargs):
-        user = User.objects.prefetch_related("groups").get(id=request.user.id)
+        user = get_user_instance(request)
 
         if request.method == 'GET':
             serializer = self.get_serializer(instance=user)
@@ -94,8 +133,9 @@ class UserViewSet(ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         new_password = serializer.data['new_password']
-        request.user.set_password(new_password)
-        request.user.save()
+        user = get_user_instance(request)
+        user.set_password(new_password)
+        user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=False, methods=['POST'])
@@ -105,9 +145,7 @@ class UserViewSet(ModelViewSet):
         user = serializer.get_user()
 
         if user:
-            context = {"user": user}
-            email = PasswordResetEmail(request, context)
-            email.send(to=[user.email])
+            enqueue_email(EmailOutbox.KIND_PASSWORD_RESET, user, request)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -124,8 +162,33 @@ class UserViewSet(ModelViewSet):
     def change_username(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = request.user
+        user = get_user_instance(request)
         new_username = serializer.data["new_" + User.USERNAME_FIELD]
         setattr(user, User.USERNAME_FIELD, new_username)
         user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenObtainPairView(PasswordHashingMixin, LoadSheddingMixin, jwt_views.TokenObtainPairView):
+    def get_max_in_flight(self):
+        return settings.AUTH_MAX_IN_FLIGHT
+
+    def get_throttles(self):
+        return [IPTokenBucketThrottle('login'), ]
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, str) else str(data)
+
+
+class MetricsView(APIView):
+    permission_classes = (IsSuperUser, )
+    renderer_classes = (PrometheusRenderer, )
+
+    def get(self, request):
+        return Response(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
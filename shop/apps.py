@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self) -> None:
+        from . import checks
+        from .signals import handlers
+
+        from core.metrics import register_collector
+        from .cache import get_metrics
+        register_collector(get_metrics)
@@ -0,0 +1,134 @@
+import time
+from hashlib import sha1
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+TAG_KEY_PREFIX = 'shop:tag'
+RESPONSE_KEY_PREFIX = 'shop:response'
+STATS_KEY_PREFIX = 'shop:response-stats'
+
+
+def get_cache():
+    return caches[getattr(settings, 'SHOP_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'SHOP_RESPONSE_CACHE_TIMEOUT', 60 * 60)
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+PRODUCT_LIST_TAG = 'product-list'
+CATEGORY_LIST_TAG = 'category-list'
+
+
+def tag_key(tag):
+    return f'{TAG_KEY_PREFIX}:{tag}'
+
+
+def new_tag_version():
+    return f'{time.time():.6f}:{uuid4().hex}'
+
+
+def tag_changed_at(version):
+    """
+    Timestamp of the invalidation that created `version`, or of the first
+    lookup after the tag was evicted.
+    """
+    try:
+        return float(version.partition(':')[0])
+    except ValueError:
+        return None
+
+
+def get_tag_versions(tags):
+    """
+    Tag versions are random tokens rather than counters, so an evicted or
+    expired tag comes back with a fresh version and can never revalidate an
+    old entry. They expire like the responses, which bounds how long a
+    process that missed an invalidation keeps serving the old version.
+    """
+    cache = get_cache()
+    keys = [tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_tag_version(), timeout=get_timeout())
+            versions[key] = cache.get(key)
+    return versions
+
+
+def invalidate_tags(tags):
+    keys = [tag_key(tag) for tag in tags]
+    if not keys:
+        return
+
+    def invalidate():
+        get_cache().set_many({key: new_tag_version() for key in keys}, timeout=get_timeout())
+
+    # invalidate right away and again after commit, so a response rendered by
+    # another request from the not yet committed state cannot stay cached
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def make_response_key(parts):
+    return f"{RESPONSE_KEY_PREFIX}:{sha1(repr(parts).encode()).hexdigest()}"
+
+
+def get_response(key):
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is not None and get_tag_versions(entry['tags']) != entry['tag_versions']:
+        entry = None
+    record_lookup(hit=entry is not None)
+    return entry
+
+
+def set_response(key, tags, tag_versions, content, headers):
+    get_cache().set(
+        key,
+        {
+            'tags': list(tags),
+            'tag_versions': tag_versions,
+            'content': content,
+            'headers': headers,
+        },
+        timeout=get_timeout(),
+    )
+
+
+def record_lookup(hit):
+    cache = get_cache()
+    key = f"{STATS_KEY_PREFIX}:{'hits' if hit else 'misses'}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    return {
+        'hits': cache.get(f'{STATS_KEY_PREFIX}:hits', 0),
+        'misses': cache.get(f'{STATS_KEY_PREFIX}:misses', 0),
+    }
+
+
+def get_metrics():
+    stats = get_stats()
+    return [
+        ('shop_response_cache_hits_total', 'counter', 'Response cache hits.', stats['hits']),
+        ('shop_response_cache_misses_total', 'counter', 'Response cache misses.', stats['misses']),
+    ]
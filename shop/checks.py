@@ -0,0 +1,33 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+from .cache import get_cache
+
+
+@register(Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    # a cache that stores nothing keeps every tag version at None, so list
+    # validators would never change and clients would get 304s forever
+    if isinstance(get_cache(), DummyCache):
+        return [Error(
+            "The shop response cache cannot use DummyCache.",
+            hint="List ETags are derived from cache tag versions, which DummyCache never stores.",
+            id='shop.E001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_response_cache(app_configs, **kwargs):
+    if isinstance(get_cache(), LocMemCache):
+        return [Error(
+            "The shop response cache is local to each process.",
+            hint=(
+                "Tag invalidations would not reach the other workers, which keep serving "
+                "stale responses and answering 304 for changed lists. Use a cache shared "
+                "by all workers, such as Redis or Memcached."
+            ),
+            id='shop.E002',
+        )]
+    return []
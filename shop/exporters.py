@@ -0,0 +1,79 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Product
+
+
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('sku', 'sku'),
+    ('name', 'name'),
+    ('slug', 'slug'),
+    ('category_id', 'category_id'),
+    ('category', 'category__title'),
+    ('description', 'description'),
+    ('price', 'price'),
+    ('inventory', 'inventory'),
+    ('datetime_created', 'datetime_created'),
+    ('datetime_modified', 'datetime_modified'),
+]
+
+HEADER = [name for name, _ in EXPORT_COLUMNS]
+
+
+def iter_product_chunks(chunk_size=2000):
+    # walk the table by primary key instead of holding one cursor open:
+    # MySQLdb buffers whole result sets client side, so .iterator() alone
+    # would not keep memory constant there
+    queryset = (
+        Product.objects
+        .order_by('id')
+        .values_list(*[lookup for _, lookup in EXPORT_COLUMNS])
+    )
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(chunks):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for rows in chunks:
+        yield ''.join(writer.writerow(row) for row in rows)
+
+
+def export_ndjson(chunks):
+    for rows in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(HEADER, row)), cls=DjangoJSONEncoder) + '\n'
+            for row in rows
+        )
+
+
+def export_json(chunks):
+    separator = '['
+    for rows in chunks:
+        yield separator + ','.join(
+            json.dumps(dict(zip(HEADER, row)), cls=DjangoJSONEncoder)
+            for row in rows
+        )
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+EXPORTERS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'json': (export_json, 'application/json'),
+}
@@ -0,0 +1,15 @@
+from rest_framework.filters import SearchFilter
+
+from .search import get_search_backend
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter that delegates matching and
+    relevance ranking to the configured full-text search backend.
+    """
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        return get_search_backend().search(queryset, search_terms)
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importers import ROW_READERS, ProductImporter, decode_lines
+
+
+class Command(BaseCommand):
+    help = "Import (upsert) products from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(ROW_READERS), help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        row_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if row_format == 'jsonl':
+            row_format = 'ndjson'
+        if row_format not in ROW_READERS:
+            raise CommandError("Unable to detect the file format. Pass --format csv or --format ndjson.")
+
+        with open(path, 'rb') as stream:
+            rows = ROW_READERS[row_format](decode_lines(stream))
+            report = ProductImporter(batch_size=options['batch_size']).run(rows)
+
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error))
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {report['processed']} rows in {report['seconds']}s "
+            f"({report['rows_per_second']} rows/s): {report['created']} created, "
+            f"{report['updated']} updated, {report['error_count']} failed."
+        ))
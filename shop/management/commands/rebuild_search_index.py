@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from shop.models import Product
+from shop.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_search_backend(using)
+        chunk_size = options['chunk_size']
+        queryset = Product.objects.using(using).select_related('category').order_by('id')
+
+        indexed = 0
+        last_id = 0
+        with transaction.atomic(using=using):
+            backend.clear()
+            while True:
+                products = list(queryset.filter(id__gt=last_id)[:chunk_size])
+                if not products:
+                    break
+                backend.index_products(products)
+                indexed += len(products)
+                last_id = products[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Recompute Category.products_count for categories whose stored count has drifted."
+
+    def handle(self, *args, **options):
+        drifted_ids = list(
+            Category.objects
+            .annotate(actual_count=Count('products'))
+            .exclude(products_count=F('actual_count'))
+            .values_list('id', flat=True)
+        )
+
+        # recount inside the UPDATE itself so products written meanwhile are not lost
+        actual_count = (
+            Product.objects
+            .filter(category=OuterRef('pk'))
+            .order_by()
+            .values('category')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        fixed = Category.objects.filter(pk__in=drifted_ids).update(
+            products_count=Coalesce(Subquery(actual_count), 0),
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled products count of {fixed} categories."))
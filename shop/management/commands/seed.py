@@ -0,0 +1,65 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from shop import cache as response_cache
+from shop.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic shop (categories, products, users, addresses, comments and carts) for load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, also keeps the rows of runs apart.")
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--addresses-per-user', type=int, default=1)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=1000)
+        parser.add_argument('--items-per-cart', type=int, default=3)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Zipf exponent of comments per product and products per category, 0 is uniform.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1, help="Insert the chunks in this many processes.")
+        parser.add_argument('--skip-search-index', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1 and options['products']:
+            raise CommandError("Products need at least one category.")
+        if options['users'] < 1 and options['comments']:
+            raise CommandError("Comments need at least one user.")
+        if options['products'] < 1 and options['carts'] and options['items_per_cart']:
+            raise CommandError("Cart items need at least one product.")
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            raise CommandError("SQLite serializes writes, use --workers 1.")
+
+        seeder = Seeder(
+            seed=options['seed'],
+            categories=options['categories'],
+            products=options['products'],
+            users=options['users'],
+            addresses_per_user=options['addresses_per_user'],
+            comments=options['comments'],
+            carts=options['carts'],
+            items_per_cart=options['items_per_cart'],
+            skew=options['skew'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            stdout=self.stdout,
+        )
+        if seeder.already_seeded():
+            raise CommandError(f"The database was already seeded with --seed {options['seed']}.")
+        report = seeder.run()
+
+        # bulk_create skipped the receivers maintaining these
+        call_command('reconcile_products_count', stdout=self.stdout)
+        if not options['skip_search_index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+        response_cache.invalidate_tags([response_cache.PRODUCT_LIST_TAG, response_cache.CATEGORY_LIST_TAG])
+
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {report.pop('seconds')}s: {json.dumps(report)}"))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_products_count(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    Product = apps.get_model('shop', 'Product')
+
+    actual_count = (
+        Product.objects
+        .filter(category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Category.objects.update(products_count=Coalesce(Subquery(actual_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_remove_comment_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_products_count, migrations.RunPython.noop),
+    ]
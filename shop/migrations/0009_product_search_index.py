@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+SQLITE_CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_search "
+    "USING fts5(name, description, category_title, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+MYSQL_CREATE_SQL = (
+    "CREATE TABLE IF NOT EXISTS shop_product_search ("
+    "product_id BIGINT NOT NULL PRIMARY KEY, "
+    "name VARCHAR(255) NOT NULL, "
+    "description LONGTEXT NOT NULL, "
+    "category_title VARCHAR(255) NOT NULL, "
+    "FULLTEXT KEY shop_product_search_fulltext (name, description, category_title)"
+    ") ENGINE=InnoDB"
+)
+
+POPULATE_SQL = (
+    "INSERT INTO shop_product_search ({id_column}, name, description, category_title) "
+    "SELECT shop_product.id, shop_product.name, shop_product.description, shop_category.title "
+    "FROM shop_product INNER JOIN shop_category ON shop_product.category_id = shop_category.id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE_SQL)
+        schema_editor.execute(POPULATE_SQL.format(id_column='rowid'))
+    elif vendor == 'mysql':
+        schema_editor.execute(MYSQL_CREATE_SQL)
+        schema_editor.execute(POPULATE_SQL.format(id_column='product_id'))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ['sqlite', 'mysql']:
+        schema_editor.execute("DROP TABLE IF EXISTS shop_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_category_products_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
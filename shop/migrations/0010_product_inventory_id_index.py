@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['inventory', 'id'], name='shop_produc_invento_c85da5_idx'),
+        ),
+    ]
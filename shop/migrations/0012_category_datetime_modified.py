@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='datetime_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
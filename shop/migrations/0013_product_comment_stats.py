@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_comment_stats(apps, schema_editor):
+    Comment = apps.get_model('shop', 'Comment')
+    Product = apps.get_model('shop', 'Product')
+
+    comments = Comment.objects.filter(product=OuterRef('pk')).order_by()
+    Product.objects.update(
+        comment_count=Coalesce(
+            Subquery(comments.values('product').annotate(count=Count('pk')).values('count')), 0,
+        ),
+        last_commented_at=Subquery(comments.order_by('-datetime_created').values('datetime_created')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_category_datetime_modified'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_commented_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'datetime_created', 'id'], name='shop_commen_product_f9244f_idx'),
+        ),
+        migrations.RunPython(populate_comment_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_product_comment_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='shop_produc_name_9fbd0c_idx'),
+        ),
+    ]
@@ -0,0 +1,165 @@
+from datetime import datetime, timezone
+from hashlib import sha1
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.response import Response
+
+from . import cache as response_cache
+
+
+class ConditionalGetMixin:
+    """
+    Adds strong ETag and Last-Modified validators to list and retrieve, and
+    answers matching If-None-Match / If-Modified-Since requests with a 304
+    before anything is serialized.
+
+    List validators come from the versions of `list_version_tags` in the
+    response cache, bumped by every write that can change a list, so they
+    cost no query. That cache must be shared by all workers (see
+    shop.checks). The ETag also covers the query string.
+    """
+    last_modified_field = 'datetime_modified'
+    list_version_tags = []
+
+    def get_list_version_tags(self):
+        return self.list_version_tags
+
+    def get_list_validators(self):
+        versions = response_cache.get_tag_versions(self.get_list_version_tags())
+        changed_at = max(
+            filter(None, map(response_cache.tag_changed_at, versions.values())),
+            default=None,
+        )
+        return {
+            **versions,
+            'last_modified': changed_at and datetime.fromtimestamp(changed_at, tz=timezone.utc),
+        }
+
+    def get_object_validators(self, instance):
+        return {
+            'pk': instance.pk,
+            'last_modified': getattr(instance, self.last_modified_field),
+        }
+
+    def get_conditional_validators(self, request, validators):
+        last_modified = max(
+            (value for key, value in validators.items() if key.endswith('last_modified') and value),
+            default=None,
+        )
+        fingerprint = repr((
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            sorted(validators.items()),
+        ))
+        etag = f'"{sha1(fingerprint.encode()).hexdigest()}"'
+        return etag, last_modified and int(last_modified.timestamp())
+
+    def conditional_response(self, request, validators, get_response):
+        etag, last_modified = self.get_conditional_validators(request, validators)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        validators = self.get_list_validators()
+        return self.conditional_response(
+            request, validators, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            request, self.get_object_validators(instance), lambda: Response(self.get_serializer(instance).data),
+        )
+
+
+class ResponseCacheMixin:
+    """
+    Serves list and retrieve from a shared cache of rendered responses.
+
+    Entries are tagged (a collection tag for lists, an object tag for details,
+    plus `related_cache_tags` for related objects they render) and are
+    invalidated by bumping tag versions from model signals, see
+    shop.signals.handlers. Tags, entries and the hit/miss counters all live
+    in the response cache, which must be shared by all workers for
+    invalidations and stats to cover them (enforced by shop.checks).
+    """
+    list_cache_tag = None
+    related_cache_tags = []
+    cached_headers = ['Content-Type', 'ETag', 'Last-Modified', 'Vary', 'Allow', ]
+
+    def get_object_cache_tag(self, pk):
+        raise NotImplementedError
+
+    def get_related_cache_tags(self):
+        return self.related_cache_tags
+
+    def is_response_cacheable(self, request):
+        return request.method == 'GET' and request.accepted_renderer.format == 'json'
+
+    def get_response_cache_key(self, request):
+        return response_cache.make_response_key((
+            request.path,
+            sorted(request.query_params.lists()),
+            request.accepted_renderer.format,
+            request.user.is_authenticated,
+        ))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            [self.list_cache_tag],
+            lambda: super(ResponseCacheMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request,
+            [self.get_object_cache_tag(pk)],
+            lambda: super(ResponseCacheMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+    def cached_response(self, request, tags, get_response):
+        if not self.is_response_cacheable(request):
+            return get_response()
+
+        key = self.get_response_cache_key(request)
+        entry = response_cache.get_response(key)
+        if entry is not None:
+            return self.build_cached_response(request, entry)
+
+        # read all tag versions before the database, so a write that lands
+        # while this response is being built leaves the stored entry already
+        # stale. Which related objects a response renders is only known after
+        # the query, so related tags are whole collections
+        all_tags = [*tags, *(tag for tag in self.get_related_cache_tags() if tag not in tags)]
+        tag_versions = response_cache.get_tag_versions(all_tags)
+        response = get_response()
+
+        if isinstance(response, Response) and response.status_code == 200:
+            def store(rendered):
+                headers = {name: rendered[name] for name in self.cached_headers if rendered.has_header(name)}
+                response_cache.set_response(key, all_tags, tag_versions, rendered.content, headers)
+
+            response.add_post_render_callback(store)
+
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def build_cached_response(self, request, entry):
+        headers = entry['headers']
+        last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+        response = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(entry['content'])
+        for name, value in headers.items():
+            response[name] = value
+        response['X-Cache'] = 'HIT'
+        return response
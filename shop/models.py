@@ -1,30 +1,81 @@
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, router
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Window
+from django.utils.text import slugify
 from uuid import uuid4
 
 
 class Category(models.Model):
     title = models.CharField(max_length=255)
     description = models.CharField(max_length=500, blank=True)
+    products_count = models.PositiveIntegerField(default=0)
+    datetime_modified = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        # products_count is maintained with F() updates by shop.signals,
+        # so never write back the (possibly stale) in-memory value
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'products_count'
+            ]
+        super().save(*args, **kwargs)
     
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='products')
     slug = models.SlugField()
+    # the key product imports are matched on
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     description = models.TextField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
     datetime_created = models.DateTimeField(auto_now_add=True)
     datetime_modified = models.DateTimeField(auto_now=True)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_commented_at = models.DateTimeField(blank=True, null=True)
+
+    # maintained with F() updates by shop.signals.handlers
+    COMMENT_STATS_FIELDS = ('comment_count', 'last_commented_at')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['inventory', 'id']),
+            models.Index(fields=['name', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def make_slug(cls, name, fallback=''):
+        # names without a single ASCII letter or digit slugify to ''
+        slug = slugify(name) or slugify(fallback)
+        return slug[:cls._meta.get_field('slug').max_length]
+
+    def save(self, *args, **kwargs):
+        # never write back the (possibly stale) in-memory comment stats
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COMMENT_STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the category the row was loaded with so that moving a product
+        # between categories can be reflected in Category.products_count
+        instance._loaded_category_id = dict(zip(field_names, values)).get('category_id')
+        return instance
+
 
 class Comment(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='comments')
@@ -32,6 +83,11 @@ class Comment(models.Model):
     body = models.TextField()
     datetime_created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'datetime_created', 'id']),
+        ]
+
 
 class Address(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='addresses')
@@ -46,7 +102,52 @@ class Address(models.Model):
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotates each item with its line total and the total of its whole cart,
+        so a cart can be rendered from a single joined query.
+        """
+        total_price = ExpressionWrapper(
+            F('quantity') * F('product__price'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        return self.select_related('cart', 'product').annotate(
+            total_price=total_price,
+            cart_total_price=Window(Sum(total_price), partition_by=[F('cart_id')]),
+        )
+
+    def add_to_cart(self, cart_id, product_id, quantity):
+        """
+        Inserts the item, or increments the quantity of the existing one,
+        in a single upsert statement. The sum is capped at the largest
+        quantity the column can hold.
+        """
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        field = self.model._meta.get_field('quantity')
+        cart_id = self.model._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        # the portable range: SQLite would otherwise accept any 64-bit value
+        _, max_quantity = BaseDatabaseOperations.integer_field_ranges[field.get_internal_type()]
+
+        if connection.vendor == 'mysql':
+            upsert = f"ON DUPLICATE KEY UPDATE quantity = LEAST(quantity + VALUES(quantity), {max_quantity})"
+        else:
+            least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+            upsert = (
+                f"ON CONFLICT (cart_id, product_id) DO UPDATE "
+                f"SET quantity = {least}({table}.quantity + excluded.quantity, {max_quantity})"
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (cart_id, product_id, quantity) VALUES (%s, %s, %s) {upsert}",
+                [cart_id, product_id, quantity],
+            )
 
 
 class CartItem(models.Model):
@@ -54,6 +155,23 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_items')
     quantity = models.PositiveSmallIntegerField()
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [['cart', 'product'], ]
-        
\ No newline at end of file
+
+
+class Order(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='orders')
+    datetime_created = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def total_price(self):
+        return sum(item.quantity * item.unit_price for item in self.items.all())
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='order_items')
+    quantity = models.PositiveSmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
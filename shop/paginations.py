@@ -1,6 +1,171 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class DefaultPagination(PageNumberPagination):
     page_size = 100
-    
\ No newline at end of file
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-method pagination over a single ordering field with `id` as the
+    tie-breaker. Pages are fetched with `WHERE (field, id) > (value, id)`
+    instead of OFFSET, and the total count is only computed on request.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    count_query_param = 'count'
+    ordering_param = api_settings.ORDERING_PARAM
+    ordering_fields = ['id', ]
+    default_ordering = 'id'
+    tie_breaker = 'id'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.field = queryset.model._meta.get_field(self.ordering.lstrip('-'))
+        self.cursor = self.decode_cursor(request)
+
+        self.count = None
+        if self.wants_count(request):
+            self.count = queryset.count()
+
+        descending = self.ordering.startswith('-')
+        reverse = bool(self.cursor and self.cursor['reverse'])
+        if self.cursor:
+            queryset = queryset.filter(self.get_keyset_filter(descending != reverse))
+        queryset = queryset.order_by(*self.get_order_by(descending != reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response_data = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response_data = {'count': self.count, **response_data}
+        return Response(response_data)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        ordering_fields = getattr(view, 'ordering_fields', None) or self.ordering_fields
+        ordering = request.query_params.get(self.ordering_param, '').strip()
+        if ordering.lstrip('-') in ordering_fields:
+            return ordering
+        return self.default_ordering
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ['1', 'true']
+
+    def get_order_by(self, descending):
+        prefix = '-' if descending else ''
+        if self.field.name == self.tie_breaker:
+            return [prefix + self.tie_breaker]
+        return [prefix + self.field.name, prefix + self.tie_breaker]
+
+    def get_keyset_filter(self, descending):
+        lookup = 'lt' if descending else 'gt'
+        tie_breaker_filter = Q(**{f'{self.tie_breaker}__{lookup}': self.cursor['id']})
+        if self.field.name == self.tie_breaker:
+            return tie_breaker_filter
+        value = self.cursor['value']
+        # the redundant bound on the field alone lets the database seek the
+        # index to the cursor, the OR would otherwise have it walk every row
+        # before it
+        return Q(**{f'{self.field.name}__{lookup}e': value}) & (
+            Q(**{f'{self.field.name}__{lookup}': value}) | tie_breaker_filter
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if data['o'] != self.ordering:
+                raise ValueError
+            value = self.field.to_python(data['v'])
+            if value is None:
+                raise ValueError
+            return {
+                'value': value,
+                'id': int(data['i']),
+                'reverse': bool(data['r']),
+            }
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        data = {
+            'o': self.ordering,
+            'v': self.field.value_to_string(instance),
+            'i': getattr(instance, self.tie_breaker),
+            'r': int(reverse),
+        }
+        encoded = urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class CommentPagination(KeysetPagination):
+    page_size = 20
+    ordering_fields = ['datetime_created', ]
+    default_ordering = '-datetime_created'
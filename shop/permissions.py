@@ -1,13 +1,15 @@
 from rest_framework import permissions
 
+from core.groups import is_in_group
+
 
 class IsInGroup(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name=view.required_group).exists()
+        return is_in_group(request.user, view.required_group)
 
 
 class IsOwnerObject(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return bool(
-            request.user and obj.user == request.user
+            request.user and obj.user_id == request.user.id
         )
@@ -0,0 +1,195 @@
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+SEARCH_INDEX_TABLE = 'shop_product_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(terms):
+    return [token for term in terms for token in TOKEN_RE.findall(term)]
+
+
+class BaseSearchBackend:
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def search(self, queryset, terms):
+        raise NotImplementedError
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def update_category_title(self, category_id, title):
+        pass
+
+    def clear(self):
+        pass
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """
+    Unindexed fallback for databases without a full-text engine.
+    """
+    search_fields = ['name', 'description', 'category__title']
+
+    def search(self, queryset, terms):
+        for term in terms:
+            condition = Q()
+            for field in self.search_fields:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class FullTextSearchBackend(BaseSearchBackend):
+    """
+    Keeps a denormalized copy of name, description and category title in
+    SEARCH_INDEX_TABLE and ranks matches by relevance (higher is better).
+    """
+    id_column = None
+    match_sql = None
+    rank_sql = None
+
+    def build_query(self, tokens):
+        raise NotImplementedError
+
+    def search(self, queryset, terms):
+        tokens = tokenize(terms)
+        if not tokens:
+            return queryset.none()
+
+        query = self.build_query(tokens)
+        opts = queryset.model._meta
+        # a join evaluates the match once, a correlated rank subquery would
+        # run it again for every matched product
+        return (
+            queryset
+            .extra(
+                tables=[SEARCH_INDEX_TABLE],
+                where=[
+                    self.match_sql,
+                    f"{SEARCH_INDEX_TABLE}.{self.id_column} = {opts.db_table}.{opts.pk.column}",
+                ],
+                params=[query],
+                select={'search_rank': self.rank_sql},
+                select_params=[query] * self.rank_sql.count('%s'),
+            )
+            .order_by('-search_rank', 'id')
+        )
+
+    def get_rows(self, products):
+        return [
+            (product.pk, product.name, product.description, product.category.title)
+            for product in products
+        ]
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE {self.id_column} IN ({placeholders})",
+                product_ids,
+            )
+
+    def update_category_title(self, category_id, title):
+        opts = Product._meta
+        category_column = opts.get_field('category').column
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {SEARCH_INDEX_TABLE} SET category_title = %s "
+                f"WHERE {self.id_column} IN "
+                f"(SELECT {opts.pk.column} FROM {opts.db_table} WHERE {category_column} = %s)",
+                (title, category_id),
+            )
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_INDEX_TABLE}")
+
+
+class SQLiteFTS5SearchBackend(FullTextSearchBackend):
+    id_column = 'rowid'
+    match_sql = f'{SEARCH_INDEX_TABLE} MATCH %s'
+    # bm25() is lower for better matches
+    rank_sql = f'-bm25({SEARCH_INDEX_TABLE})'
+
+    def build_query(self, tokens):
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def index_products(self, products):
+        rows = self.get_rows(products)
+        if not rows:
+            return
+        self.remove_products(row[0] for row in rows)
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_INDEX_TABLE} (rowid, name, description, category_title) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+class MySQLFullTextSearchBackend(FullTextSearchBackend):
+    """
+    InnoDB FULLTEXT index in boolean mode. MySQL leaves stopwords and tokens
+    shorter than innodb_ft_min_token_size out of the index, so requiring one
+    of them would match nothing: those are only used for ranking. Keep
+    `min_token_size` and `stopwords` in line with the server configuration.
+    """
+    id_column = 'product_id'
+    match_sql = (
+        f'MATCH ({SEARCH_INDEX_TABLE}.name, {SEARCH_INDEX_TABLE}.description, {SEARCH_INDEX_TABLE}.category_title) '
+        'AGAINST (%s IN BOOLEAN MODE)'
+    )
+    rank_sql = match_sql
+    min_token_size = 3
+    # INNODB_FT_DEFAULT_STOPWORD
+    stopwords = frozenset([
+        'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how',
+        'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what',
+        'when', 'where', 'who', 'will', 'with', 'und', 'www',
+    ])
+
+    def is_indexed(self, token):
+        return len(token) >= self.min_token_size and token.lower() not in self.stopwords
+
+    def build_query(self, tokens):
+        return ' '.join(f'+{token}*' if self.is_indexed(token) else f'{token}*' for token in tokens)
+
+    def index_products(self, products):
+        rows = self.get_rows(products)
+        if not rows:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(
+                f"REPLACE INTO {SEARCH_INDEX_TABLE} (product_id, name, description, category_title) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5SearchBackend,
+    'mysql': MySQLFullTextSearchBackend,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    backend_path = getattr(settings, 'SHOP_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)(using)
+    return VENDOR_BACKENDS.get(connections[using].vendor, BasicSearchBackend)(using)
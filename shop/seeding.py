@@ -0,0 +1,301 @@
+import multiprocessing
+import random
+import time
+from decimal import Decimal
+from itertools import accumulate, islice
+from uuid import UUID
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Max
+from django.utils.text import slugify
+
+from core import hashing
+
+from .models import Address, Cart, CartItem, Category, Comment, Product
+from .signals.handlers import refresh_comment_stats
+
+
+ADJECTIVES = [
+    'Classic', 'Compact', 'Deluxe', 'Durable', 'Elegant', 'Essential', 'Handmade', 'Light',
+    'Modern', 'Portable', 'Premium', 'Rustic', 'Smart', 'Sturdy', 'Vintage', 'Wireless',
+]
+NOUNS = [
+    'Backpack', 'Blender', 'Chair', 'Desk', 'Headphones', 'Jacket', 'Kettle', 'Lamp',
+    'Mug', 'Notebook', 'Pillow', 'Sneakers', 'Speaker', 'Teapot', 'Watch', 'Wallet',
+]
+FIRST_NAMES = ['Ali', 'Sara', 'Reza', 'Maryam', 'Omid', 'Zahra', 'Hamed', 'Neda', 'Kian', 'Leila']
+LAST_NAMES = ['Azad', 'Ahmadi', 'Karimi', 'Rahimi', 'Hosseini', 'Moradi', 'Jafari', 'Kazemi']
+PLACES = [
+    ('Tehran', 'Tehran'), ('Isfahan', 'Isfahan'), ('Fars', 'Shiraz'), ('Khorasan', 'Mashhad'),
+    ('East Azerbaijan', 'Tabriz'), ('Gilan', 'Rasht'), ('Kerman', 'Kerman'), ('Yazd', 'Yazd'),
+]
+SENTENCES = [
+    "Works as described.", "Arrived a day late but well packed.", "Great value for the price.",
+    "The color is slightly different from the photos.", "Would buy again.",
+    "Stopped working after a month.", "Exactly what I needed.", "Quality could be better.",
+]
+
+# refresh_comment_stats() runs an UPDATE ... WHERE id IN (...) per chunk
+STATS_CHUNK_SIZE = 1000
+
+# per process state of the chunk functions, see Seeder.run_chunks()
+_context = {}
+
+
+def zipf_weights(size, skew):
+    """
+    Weight of every rank 1..size under a Zipf distribution, a skew of 0 is
+    uniform and the larger the skew the more the first ranks dominate.
+    """
+    return [1 / rank ** skew for rank in range(1, size + 1)]
+
+
+def zipf_counts(total, size, skew):
+    """
+    Splits `total` over `size` ranks following zipf_weights(), the counts
+    always add up to `total`.
+    """
+    if not size:
+        return []
+    weights = zipf_weights(size, skew)
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for rank in range(total - sum(counts)):
+        counts[rank % size] += 1
+    return counts
+
+
+def get_random(seed, name, chunk):
+    # string seeds are hashed deterministically, unlike tuples or hash()
+    return random.Random(f'{seed}:{name}:{chunk}')
+
+
+def chunked(items, size):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def insert_users(chunk):
+    index, start, stop = chunk
+    context = _context
+    rng = get_random(context['seed'], 'users', index)
+    User = get_user_model()
+    User.objects.bulk_create([
+        User(
+            email=f"user-{number}@{context['email_domain']}",
+            password=context['password_hash'],
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+        )
+        for number in range(start, stop)
+    ], batch_size=context['batch_size'])
+    return stop - start
+
+
+def insert_products(chunk):
+    index, start, stop = chunk
+    context = _context
+    rng = get_random(context['seed'], 'products', index)
+    products = []
+    for number in range(start, stop):
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {context['seed']}-{number}"
+        products.append(Product(
+            name=name,
+            slug=slugify(name),
+            sku=f"SKU-{context['seed']}-{number}",
+            category_id=rng.choices(context['category_ids'], cum_weights=context['category_cum_weights'])[0],
+            description=" ".join(rng.sample(SENTENCES, 3)),
+            price=Decimal(rng.randint(100, 999999)) / 100,
+            inventory=0 if rng.random() < 0.05 else rng.randint(1, 500),
+        ))
+    Product.objects.bulk_create(products, batch_size=context['batch_size'])
+    return len(products)
+
+
+def insert_addresses(chunk):
+    index, start, stop = chunk
+    context = _context
+    rng = get_random(context['seed'], 'addresses', index)
+    addresses = []
+    for user_id in context['user_ids'][start:stop]:
+        for _ in range(context['addresses_per_user']):
+            province, city = rng.choice(PLACES)
+            addresses.append(Address(
+                user_id=user_id,
+                province=province,
+                city=city,
+                street=f"No. {rng.randint(1, 300)}, {rng.choice(LAST_NAMES)} St.",
+            ))
+    Address.objects.bulk_create(addresses, batch_size=context['batch_size'])
+    return len(addresses)
+
+
+def insert_comments(chunk):
+    index, counts = chunk
+    context = _context
+    rng = get_random(context['seed'], 'comments', index)
+    comments = [
+        Comment(
+            product_id=product_id,
+            user_id=rng.choice(context['user_ids']),
+            body=" ".join(rng.sample(SENTENCES, rng.randint(1, 3))),
+        )
+        for product_id, count in counts
+        for _ in range(count)
+    ]
+    Comment.objects.bulk_create(comments, batch_size=context['batch_size'])
+    return len(comments)
+
+
+def insert_carts(chunk):
+    index, start, stop = chunk
+    context = _context
+    rng = get_random(context['seed'], 'carts', index)
+    carts, items = [], []
+    items_per_cart = min(context['items_per_cart'], len(context['product_ids']))
+    for _ in range(start, stop):
+        cart = Cart(id=UUID(int=rng.getrandbits(128), version=4))
+        carts.append(cart)
+        for product_id in rng.sample(context['product_ids'], items_per_cart):
+            items.append(CartItem(cart_id=cart.id, product_id=product_id, quantity=rng.randint(1, 5)))
+    Cart.objects.bulk_create(carts, batch_size=context['batch_size'])
+    CartItem.objects.bulk_create(items, batch_size=context['batch_size'])
+    return len(carts)
+
+
+class Seeder:
+    """
+    Generates a synthetic shop with bulk_create in chunks of `batch_size`
+    rows, optionally spread over `workers` forked processes.
+
+    Every chunk draws from its own random generator seeded with `seed`, the
+    table and the chunk number, so the same options produce the same data
+    whatever the number of workers. Comments per product and products per
+    category follow a Zipf distribution of exponent `skew`.
+
+    bulk_create skips the signal receivers, so the denormalized counters are
+    not maintained while seeding, see the seed command.
+    """
+    def __init__(self, seed=0, categories=20, products=10000, users=1000, addresses_per_user=1,
+                 comments=50000, carts=1000, items_per_cart=3, skew=1.1, password='password',
+                 batch_size=5000, workers=1, stdout=None):
+        self.seed = seed
+        self.categories = categories
+        self.products = products
+        self.users = users
+        self.addresses_per_user = addresses_per_user
+        self.comments = comments
+        self.carts = carts
+        self.items_per_cart = items_per_cart
+        self.skew = skew
+        self.password = password
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stdout = stdout
+        self.email_domain = f'seed-{seed}.example.com'
+
+    def already_seeded(self):
+        return get_user_model().objects.filter(email__endswith=f'@{self.email_domain}').exists()
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def run_chunks(self, function, chunks, context):
+        global _context
+        _context = context
+        if self.workers == 1:
+            return sum(map(function, chunks))
+
+        # the children must not share the parent's database connections
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(self.workers) as pool:
+            return sum(pool.imap_unordered(function, chunks))
+
+    def ranges(self, total, size=None):
+        size = size or self.batch_size
+        return [
+            (index, start, min(start + size, total))
+            for index, start in enumerate(range(0, total, size))
+        ]
+
+    def new_ids(self, model, last_id):
+        return list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True))
+
+    def last_id(self, model):
+        return model.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+
+    def run(self):
+        started = time.perf_counter()
+        report = {}
+        User = get_user_model()
+        context = {'seed': self.seed, 'batch_size': self.batch_size, 'email_domain': self.email_domain}
+
+        last_category_id = self.last_id(Category)
+        Category.objects.bulk_create([
+            Category(title=f"Category {self.seed}-{number}", description=f"Synthetic category {number}.")
+            for number in range(self.categories)
+        ])
+        context['category_ids'] = self.new_ids(Category, last_category_id)
+        context['category_cum_weights'] = list(accumulate(zipf_weights(self.categories, self.skew)))
+        report['categories'] = self.categories
+        self.log(f"Created {self.categories} categories.")
+
+        last_user_id = self.last_id(User)
+        # a single hash shared by all users instead of one PBKDF2 run per row
+        context['password_hash'] = hashing.make_password(self.password)
+        report['users'] = self.run_chunks(insert_users, self.ranges(self.users), context)
+        context['user_ids'] = self.new_ids(User, last_user_id)
+        self.log(f"Created {report['users']} users.")
+
+        last_product_id = self.last_id(Product)
+        report['products'] = self.run_chunks(insert_products, self.ranges(self.products), context)
+        context['product_ids'] = self.new_ids(Product, last_product_id)
+        self.log(f"Created {report['products']} products.")
+
+        context['addresses_per_user'] = self.addresses_per_user
+        report['addresses'] = self.run_chunks(insert_addresses, self.ranges(
+            self.users, max(1, self.batch_size // max(1, self.addresses_per_user)),
+        ), context)
+        self.log(f"Created {report['addresses']} addresses.")
+
+        # the most commented products are spread over the whole id range
+        ranked_product_ids = list(context['product_ids'])
+        get_random(self.seed, 'comment-ranks', 0).shuffle(ranked_product_ids)
+        comment_plan = [
+            (product_id, count)
+            for product_id, count in zip(ranked_product_ids, zipf_counts(self.comments, len(ranked_product_ids), self.skew))
+            if count
+        ]
+        report['comments'] = self.run_chunks(insert_comments, self.comment_chunks(comment_plan), context)
+        self.log(f"Created {report['comments']} comments.")
+
+        context['items_per_cart'] = self.items_per_cart
+        report['carts'] = self.run_chunks(insert_carts, self.ranges(
+            self.carts, max(1, self.batch_size // max(1, self.items_per_cart)),
+        ), context)
+        self.log(f"Created {report['carts']} carts.")
+
+        for product_ids in chunked(sorted(product_id for product_id, _ in comment_plan), STATS_CHUNK_SIZE):
+            refresh_comment_stats(product_ids)
+
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        return report
+
+    def comment_chunks(self, comment_plan):
+        """
+        Groups the (product_id, count) pairs into chunks of about
+        `batch_size` comments, a single product may exceed it.
+        """
+        chunks, chunk, size = [], [], 0
+        for product_id, count in comment_plan:
+            chunk.append((product_id, count))
+            size += count
+            if size >= self.batch_size:
+                chunks.append((len(chunks), chunk))
+                chunk, size = [], 0
+        if chunk:
+            chunks.append((len(chunks), chunk))
+        return chunks
@@ -1,11 +1,15 @@
-from django.utils.text import slugify
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Category, Comment, Product
+from . import cache as response_cache
+from .models import Cart, CartItem, Category, Comment, Order, OrderItem, Product
+from .signals.handlers import add_comment_stats
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    num_of_products = serializers.IntegerField(source='products.count')
+    num_of_products = serializers.IntegerField(source='products_count', read_only=True)
 
     class Meta:
         model = Category
@@ -29,18 +33,19 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'category', 'inventory', 'price', 'description', ]
+        fields = ['id', 'sku', 'name', 'category', 'inventory', 'price', 'description', 'comment_count', 'last_commented_at', ]
 
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['name', 'category', 'description', 'price', 'inventory', ]
+        fields = ['sku', 'name', 'category', 'description', 'price', 'inventory', ]
     
     def create(self, validated_data):
         product = Product(**validated_data)
-        product.slug = slugify(product.name)
-        product.save()
+        product.slug = Product.make_slug(product.name, fallback=product.sku or '')
+        with transaction.atomic():
+            product.save()
         return product
     
     def update(self, instance, validated_data):
@@ -50,11 +55,21 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
                 field,
                 validated_data.get(field, getattr(instance, field))
             )
-        instance.slug = slugify(instance.name)
-        instance.save()
+        instance.slug = Product.make_slug(instance.name, fallback=instance.sku or '')
+        with transaction.atomic():
+            instance.save()
         return instance
     
 
+class ProductImportRowSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    category = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    price = serializers.DecimalField(max_digits=6, decimal_places=2)
+    inventory = serializers.IntegerField(min_value=0)
+    
+
 class CommentSerializer(serializers.ModelSerializer):
     user = serializers.CharField(source="user.full_name")
 
@@ -68,10 +83,147 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         model = Comment
         fields = ['body', ]
 
+    def validate(self, data):
+        if not Product.objects.filter(pk=self.context['product_pk']).exists():
+            raise serializers.ValidationError("No product with the given id was found.")
+        return data
+
     def create(self, validated_data):
         comment = Comment(**validated_data)
         comment.product_id = self.context['product_pk']
-        comment.user = self.context['request'].user
-        comment.save()
+        comment.user_id = self.context['request'].user.id
+        with transaction.atomic():
+            comment.save()
+            add_comment_stats(comment)
         return comment
-        
\ No newline at end of file
+
+
+class CartProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', ]
+
+
+class CartItemSerializer(serializers.ModelSerializer):
+    product = CartProductSerializer()
+    total_price = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'quantity', 'total_price', ]
+
+
+class CartSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(read_only=True)
+    items = CartItemSerializer(source='line_items', many=True, read_only=True)
+    total_price = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'items', 'total_price', ]
+
+
+class AddCartItemSerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product_id', 'quantity', ]
+
+    def validate_product_id(self, value):
+        if not Product.objects.filter(pk=value).exists():
+            raise serializers.ValidationError("No product with the given id was found.")
+        return value
+
+    def validate(self, data):
+        if not Cart.objects.filter(pk=self.context['cart_pk']).exists():
+            raise serializers.ValidationError("No cart with the given id was found.")
+        return data
+
+    def create(self, validated_data):
+        cart_id = self.context['cart_pk']
+        product_id = validated_data['product_id']
+        CartItem.objects.add_to_cart(cart_id, product_id, validated_data['quantity'])
+        return CartItem.objects.get(cart_id=cart_id, product_id=product_id)
+
+
+class UpdateCartItemSerializer(serializers.ModelSerializer):
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+    class Meta:
+        model = CartItem
+        fields = ['quantity', ]
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product = CartProductSerializer()
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'quantity', 'unit_price', ]
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True)
+    total_price = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'datetime_created', 'items', 'total_price', ]
+
+
+class CreateOrderSerializer(serializers.Serializer):
+    cart_id = serializers.UUIDField()
+
+    def save(self, **kwargs):
+        cart_id = self.validated_data['cart_id']
+
+        with transaction.atomic():
+            # a concurrent checkout of the same cart waits here and then finds
+            # it deleted, so the cart cannot be ordered twice
+            if not Cart.objects.select_for_update().filter(pk=cart_id).exists():
+                raise serializers.ValidationError({"cart_id": "The cart is empty or does not exist."})
+
+            # lock products in a consistent order so concurrent checkouts cannot deadlock
+            cart_items = list(
+                CartItem.objects
+                .filter(cart_id=cart_id)
+                .order_by('product_id')
+                .values_list('product_id', 'quantity', 'product__price')
+            )
+            if not cart_items:
+                raise serializers.ValidationError({"cart_id": "The cart is empty or does not exist."})
+
+            # reserve stock with conditional decrements instead of SELECT ... FOR UPDATE;
+            # a line whose UPDATE matches no row has run out of stock
+            now = timezone.now()
+            out_of_stock = [
+                product_id for product_id, quantity, _ in cart_items
+                if not Product.objects.filter(pk=product_id, inventory__gte=quantity).update(
+                    inventory=F('inventory') - quantity,
+                    datetime_modified=now,
+                )
+            ]
+            if out_of_stock:
+                # raising inside atomic() rolls back the decrements that did succeed
+                raise serializers.ValidationError(
+                    {"out_of_stock": out_of_stock},
+                    code="out_of_stock",
+                )
+
+            order = Order.objects.create(user_id=self.context['request'].user.id)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_id, quantity=quantity, unit_price=price)
+                for product_id, quantity, price in cart_items
+            ])
+            # without row locks (SQLite) the delete is what claims the cart
+            if not Cart.objects.filter(pk=cart_id).delete()[0]:
+                raise serializers.ValidationError({"cart_id": "The cart is empty or does not exist."})
+
+            response_cache.invalidate_tags([
+                response_cache.PRODUCT_LIST_TAG,
+                *(response_cache.product_tag(product_id) for product_id, _, _ in cart_items),
+            ])
+
+        return order
@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from shop import cache as response_cache
+from shop.models import Category, Comment, Product
+from shop.search import get_search_backend
+
+
+def change_products_count(category_id, delta):
+    Category.objects.filter(pk=category_id).update(
+        products_count=F('products_count') + delta,
+        datetime_modified=timezone.now(),
+    )
+    response_cache.invalidate_tags([
+        response_cache.category_tag(category_id),
+        response_cache.CATEGORY_LIST_TAG,
+    ])
+
+
+def change_comment_stats(product_ids, **stats):
+    Product.objects.filter(pk__in=product_ids).update(**stats, datetime_modified=timezone.now())
+    response_cache.invalidate_tags(
+        [response_cache.product_tag(product_id) for product_id in product_ids]
+        + [response_cache.PRODUCT_LIST_TAG]
+    )
+
+
+def latest_comment_datetime():
+    return Subquery(
+        Comment.objects
+        .filter(product=OuterRef('pk'))
+        .order_by('-datetime_created', '-id')
+        .values('datetime_created')[:1]
+    )
+
+
+# Comment has no signal receivers on purpose: deleting a product cascades to
+# its comments with a single DELETE only as long as nothing listens to them.
+# The comment views call these helpers instead.
+
+def add_comment_stats(comment):
+    created = Value(comment.datetime_created)
+    change_comment_stats(
+        [comment.product_id],
+        comment_count=F('comment_count') + 1,
+        last_commented_at=Greatest(Coalesce('last_commented_at', created), created),
+    )
+
+
+def remove_comment_stats(comment):
+    change_comment_stats(
+        [comment.product_id],
+        comment_count=F('comment_count') - 1,
+        last_commented_at=latest_comment_datetime(),
+    )
+
+
+def refresh_comment_stats(product_ids):
+    comment_count = (
+        Comment.objects
+        .filter(product=OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    change_comment_stats(
+        product_ids,
+        comment_count=Coalesce(Subquery(comment_count), 0),
+        last_commented_at=latest_comment_datetime(),
+    )
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remember_commented_products(sender, instance, **kwargs):
+    instance._commented_product_ids = list(
+        Comment.objects.filter(user=instance).values_list('product_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def refresh_comment_stats_of_deleted_user(sender, instance, **kwargs):
+    # the user's comments were removed by the cascade
+    product_ids = getattr(instance, '_commented_product_ids', [])
+    if product_ids:
+        refresh_comment_stats(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def update_products_count_on_save(sender, instance, created, raw, **kwargs):
+    loaded_category_id = getattr(instance, '_loaded_category_id', None)
+    if raw:
+        pass
+    elif created:
+        change_products_count(instance.category_id, 1)
+    elif loaded_category_id is not None and loaded_category_id != instance.category_id:
+        change_products_count(loaded_category_id, -1)
+        change_products_count(instance.category_id, 1)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Product)
+def update_products_count_on_delete(sender, instance, **kwargs):
+    change_products_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw, using, **kwargs):
+    if not raw:
+        get_search_backend(using).index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index_on_delete(sender, instance, using, **kwargs):
+    get_search_backend(using).remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def update_category_title_in_index(sender, instance, created, raw, using, **kwargs):
+    if not (created or raw):
+        get_search_backend(using).update_category_title(instance.pk, instance.title)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    response_cache.invalidate_tags([
+        response_cache.product_tag(instance.pk),
+        response_cache.PRODUCT_LIST_TAG,
+    ])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    response_cache.invalidate_tags([
+        response_cache.category_tag(instance.pk),
+        response_cache.CATEGORY_LIST_TAG,
+    ])
@@ -1,3 +1,808 @@
-from django.test import TestCase
+import json
+import time
+import tracemalloc
+from unittest import mock, skipUnless
+from base64 import urlsafe_b64encode
+from io import StringIO
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Max
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.test import APIClient
+
+from core.models import User
+from core.testing import QueryBudgetMixin, QueryPlanMixin, run_concurrently
+
+from .checks import check_response_cache, check_shared_response_cache
+from .models import Address, Cart, CartItem, Category, Comment, Order, OrderItem, Product
+from .exporters import export_csv, iter_product_chunks
+from .importers import ProductImporter, read_csv_rows
+from .mixins import ConditionalGetMixin
+from .paginations import KeysetPagination
+from .search import MySQLFullTextSearchBackend
+from .seeding import zipf_counts
+
+
+class ShopQueryTests(QueryBudgetMixin, QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="customer@example.com", password="password")
+        cls.category = Category.objects.create(title="Category 0")
+        cls.product = Product.objects.create(
+            name="Product 0", category=cls.category, slug="product-0",
+            description="Description", price=10, inventory=10,
+        )
+        cls.cart = Cart.objects.create()
+
+    def get_client(self):
+        client = super().get_client()
+        client.force_authenticate(self.user)
+        return client
+
+    def get_budgets(self):
+        return {
+            "/shop/categories/": 1,
+            f"/shop/categories/{self.category.id}/": 1,
+            "/shop/products/": 2,
+            "/shop/products/?pagination=cursor&ordering=-inventory": 2,
+            "/shop/products/?pagination=cursor&ordering=name": 2,
+            "/shop/products/?search=product": 2,
+            f"/shop/products/{self.product.id}/": 1,
+            f"/shop/products/{self.product.id}/comments/": 1,
+            f"/shop/carts/{self.cart.id}/": 1,
+            f"/shop/carts/{self.cart.id}/items/": 1,
+            "/shop/orders/": 3,
+        }
+
+    def get_query_plans(self):
+        return {
+            "/shop/categories/": ["SCAN shop_category"],
+            # the page is read in rowid order and the scan stops at its LIMIT
+            "/shop/products/": ["SCAN shop_product"],
+            "/shop/products/?pagination=cursor&ordering=-inventory": [],
+            "/shop/products/?pagination=cursor&ordering=name": [],
+            # ranked by relevance
+            "/shop/products/?search=product": ["USE TEMP B-TREE FOR ORDER BY"],
+            f"/shop/products/{self.product.id}/": [],
+            f"/shop/products/{self.product.id}/comments/": [],
+            f"/shop/products/{self.product.id}/comments/?ordering=datetime_created": [],
+            # the window function runs over the items of a single cart
+            f"/shop/carts/{self.cart.id}/": ["USE TEMP B-TREE FOR ORDER BY"],
+            "/shop/orders/": [],
+        }
+
+    def seed(self, size):
+        start = Category.objects.count()
+        categories = Category.objects.bulk_create(
+            [Category(title=f"Category {i}") for i in range(start, size)]
+        )
+        start = Product.objects.count()
+        products = Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", category=categories[i % len(categories)], slug=f"product-{i}",
+                description="Description", price=10, inventory=i,
+            )
+            for i in range(start, size)
+        ])
+        Comment.objects.bulk_create(
+            [Comment(product=self.product, user=self.user, body="Comment") for _ in range(start, size)]
+        )
+        CartItem.objects.bulk_create(
+            [CartItem(cart=self.cart, product=product, quantity=1) for product in products]
+        )
+        orders = Order.objects.bulk_create([Order(user=self.user) for _ in range(start, size)])
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product=self.product, quantity=1, unit_price=10) for order in orders]
+        )
+
+
+class CategoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="manager@example.com", password="password")
+        cls.user.groups.add(Group.objects.create(name="Product Management"))
+        cls.category = Category.objects.create(title="Category")
+        Product.objects.create(
+            name="Product", category=cls.category, slug="product",
+            description="Description", price=10, inventory=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_do_not_grow_with_products(self):
+        with self.assertNumQueries(1):
+            self.client.get("/shop/categories/")
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", category=Category.objects.create(title=f"Category {i}"),
+                slug=f"product-{i}", description="Description", price=10, inventory=i,
+            )
+            for i in range(50)
+        ])
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get("/shop/categories/")
+        self.assertEqual(len(response.json()), 51)
+
+    def test_destroy_with_products_is_rejected(self):
+        response = self.client.delete(f"/shop/categories/{self.category.id}/")
+        self.assertEqual(response.status_code, 405)
+
+    def test_destroy_with_stale_count_is_rejected(self):
+        Category.objects.filter(pk=self.category.pk).update(products_count=0)
+        response = self.client.delete(f"/shop/categories/{self.category.id}/")
+        self.assertEqual(response.status_code, 405)
+        self.assertTrue(Category.objects.filter(pk=self.category.pk).exists())
+
+
+class ConditionalListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="manager@example.com", password="password")
+        cls.user.groups.add(Group.objects.create(name="Product Management"))
+        category = Category.objects.create(title="Category")
+        cls.products = [
+            Product.objects.create(
+                name=f"Product {i}", category=category, slug=f"product-{i}",
+                description="Description", price=10, inventory=10,
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_deleting_a_product_changes_the_list_etag(self):
+        etag = self.client.get("/shop/products/")["ETag"]
+        self.assertEqual(self.client.get("/shop/products/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.delete(f"/shop/products/{self.products[0].id}/")
+        self.assertEqual(response.status_code, 204)
+
+        response = self.client.get("/shop/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual([product["id"] for product in response.json()["results"]], [self.products[1].id])
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get("/shop/products/")["Last-Modified"]
+        self.assertEqual(self.client.get("/shop/products/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # Last-Modified has a resolution of one second
+        with mock.patch("shop.cache.time.time", return_value=time.time() + 2):
+            response = self.client.patch(f"/shop/products/{self.products[0].id}/", {"inventory": 5}, format="json")
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get("/shop/products/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(parse_http_date(response["Last-Modified"]), parse_http_date(last_modified))
+
+    def test_detail_not_modified(self):
+        url = f"/shop/products/{self.products[0].id}/"
+        response = self.client.get(url)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        for _ in range(2):
+            # served from the response cache, then rendered again
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+            cache.clear()
+
+        self.client.patch(url, {"inventory": 5}, format="json")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["inventory"], 5)
+
+    def test_tag_versions_expire(self):
+        etag = self.client.get("/shop/products/")["ETag"]
+        with mock.patch("shop.cache.time.time", return_value=time.time() + settings.SHOP_RESPONSE_CACHE_TIMEOUT + 1):
+            response = self.client.get("/shop/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="manager@example.com", password="password")
+        cls.user.groups.add(Group.objects.create(name="Product Management"))
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="password")
+        cls.category = Category.objects.create(title="Lighting")
+        cls.product = Product.objects.create(
+            name="Lamp", category=cls.category, slug="lamp",
+            description="Description", price=10, inventory=10,
+        )
+        cls.url = f"/shop/products/{cls.product.id}/"
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response["X-Cache"], response.json()
+
+    def get_stats(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client.get("/shop/cache/stats/").json()
+
+    def test_hits_and_misses(self):
+        self.assertEqual(self.get(self.url)[0], "MISS")
+        self.assertEqual(self.get(self.url)[0], "HIT")
+        self.assertEqual(self.get("/shop/products/")[0], "MISS")
+        self.assertEqual(self.get("/shop/products/")[0], "HIT")
+        self.assertEqual(self.get_stats(), {"hits": 2, "misses": 2})
+        self.assertEqual(self.client.get("/shop/cache/stats/").status_code, 403)
+
+    def test_product_writes_invalidate(self):
+        self.get(self.url), self.get("/shop/products/")
+        self.client.patch(self.url, {"inventory": 3}, format="json")
+
+        self.assertEqual(self.get(self.url), ("MISS", mock.ANY))
+        self.assertEqual(self.get(self.url)[1]["inventory"], 3)
+        self.assertEqual(self.get("/shop/products/"), ("MISS", mock.ANY))
+        self.assertEqual(self.get("/shop/products/")[1]["results"][0]["inventory"], 3)
+
+    def test_category_writes_invalidate_products(self):
+        self.get(self.url), self.get("/shop/products/")
+        self.client.patch(f"/shop/categories/{self.category.id}/", {"title": "Lamps"}, format="json")
+
+        self.assertEqual(self.get(self.url), ("MISS", mock.ANY))
+        self.assertEqual(self.get(self.url)[1]["category"], "Lamps")
+        self.assertEqual(self.get("/shop/products/")[1]["results"][0]["category"], "Lamps")
+
+    def test_category_write_during_a_miss(self):
+        retrieve = ConditionalGetMixin.retrieve
+
+        def retrieve_then_rename(view, request, *args, **kwargs):
+            response = retrieve(view, request, *args, **kwargs)
+            category = Category.objects.get(pk=self.category.pk)
+            category.title = "Lamps"
+            category.save()
+            return response
+
+        with mock.patch.object(ConditionalGetMixin, "retrieve", retrieve_then_rename):
+            self.assertEqual(self.get(self.url)[1]["category"], "Lighting")
+        # the entry was stored with the category versions read before the query
+        self.assertEqual(self.get(self.url), ("MISS", mock.ANY))
+        self.assertEqual(self.get(self.url)[1]["category"], "Lamps")
+
+
+class ResponseCacheCheckTests(SimpleTestCase):
+    def cache_settings(self, backend):
+        return override_settings(CACHES={"default": {"BACKEND": f"django.core.cache.backends.{backend}"}})
+
+    def test_dummy_cache_is_rejected(self):
+        with self.cache_settings("dummy.DummyCache"):
+            self.assertEqual([error.id for error in check_response_cache(None)], ["shop.E001"])
+            self.assertEqual(check_shared_response_cache(None), [])
+
+    def test_process_local_cache_is_rejected_on_deploy(self):
+        with self.cache_settings("locmem.LocMemCache"):
+            self.assertEqual(check_response_cache(None), [])
+            self.assertEqual([error.id for error in check_shared_response_cache(None)], ["shop.E002"])
+
+    def test_shared_cache(self):
+        with self.cache_settings("filebased.FileBasedCache"):
+            self.assertEqual(check_response_cache(None) + check_shared_response_cache(None), [])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email="customer@example.com", password="password")
+        category = Category.objects.create(title="Category")
+        cls.product = Product.objects.create(
+            name="Product", category=category, slug="product",
+            description="Description", price=10, inventory=10,
+        )
+        Comment.objects.create(product=cls.product, user=user, body="Comment")
+
+    def encode(self, **data):
+        return urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    def test_tampered_cursors_are_not_found(self):
+        for url, cursor in [
+            ("/shop/products/?pagination=cursor&ordering=-inventory", self.encode(o="-inventory", v="abc", i=1, r=0)),
+            ("/shop/products/?pagination=cursor&ordering=-inventory", self.encode(o="-inventory", v=None, i=1, r=0)),
+            ("/shop/products/?pagination=cursor", self.encode(o="id", v=1, i="abc", r=0)),
+            ("/shop/products/?pagination=cursor", "not base64"),
+            (f"/shop/products/{self.product.id}/comments/", self.encode(o="-datetime_created", v="abc", i=1, r=0)),
+        ]:
+            with self.subTest(url=url, cursor=cursor):
+                response = self.client.get(f"{url}&cursor={cursor}" if "?" in url else f"{url}?cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {"detail": "Invalid cursor"})
+
+    def test_next_link_round_trips(self):
+        response = self.client.get(f"/shop/products/{self.product.id}/comments/?page_size=1")
+        self.assertEqual(len(response.json()["results"]), 1)
+        Comment.objects.create(product=self.product, user=User.objects.get(), body="Newer")
+        response = self.client.get(f"/shop/products/{self.product.id}/comments/?page_size=1")
+        next_page = self.client.get(response.json()["next"])
+        self.assertEqual(next_page.status_code, 200)
+        self.assertEqual([comment["body"] for comment in next_page.json()["results"]], ["Comment"])
+
+    def test_pages_cover_ties_once(self):
+        user = User.objects.get()
+        Comment.objects.bulk_create([Comment(product=self.product, user=user, body=f"Tie {i}") for i in range(5)])
+        Comment.objects.filter(product=self.product).update(datetime_created=timezone.now())
+        url, ids = f"/shop/products/{self.product.id}/comments/?page_size=2", []
+        while url:
+            response = self.client.get(url).json()
+            ids += [comment["id"] for comment in response["results"]]
+            url = response["next"]
+        self.assertEqual(ids, sorted(Comment.objects.values_list("id", flat=True), reverse=True))
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_cursor_seeks_the_index(self):
+        comment = Comment.objects.get()
+        paginator = KeysetPagination()
+        paginator.field = Comment._meta.get_field("datetime_created")
+        paginator.cursor = {"value": comment.datetime_created, "id": comment.id, "reverse": False}
+        # explain() keeps the query parameters, SQLite plans OR terms over
+        # inlined constants differently
+        plan = (
+            Comment.objects.filter(product=self.product)
+            .filter(paginator.get_keyset_filter(descending=True))
+            .order_by("-datetime_created", "-id")
+            .explain()
+        )
+        self.assertIn("datetime_created<?", plan)
+
+
+class CommentStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="customer@example.com", password="password")
+        category = Category.objects.create(title="Category")
+        cls.product = Product.objects.create(
+            name="Product", category=category, slug="product",
+            description="Description", price=10, inventory=10,
+        )
+        cls.url = f"/shop/products/{cls.product.id}/comments/"
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_stats(self):
+        self.product.refresh_from_db()
+        return self.product.comment_count, self.product.last_commented_at
+
+    def test_creating_comments_updates_the_stats(self):
+        response = self.client.post(self.url, {"body": "First"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        first = Comment.objects.get(pk=response.json()["id"])
+        self.assertEqual(self.get_stats(), (1, first.datetime_created))
+
+        response = self.client.post(self.url, {"body": "Second"}, format="json")
+        second = Comment.objects.get(pk=response.json()["id"])
+        self.assertEqual(self.get_stats(), (2, second.datetime_created))
+        self.assertEqual(self.client.get(f"/shop/products/{self.product.id}/").json()["comment_count"], 2)
+
+    def test_deleting_comments_updates_the_stats(self):
+        first, second = [
+            Comment.objects.get(pk=self.client.post(self.url, {"body": body}, format="json").json()["id"])
+            for body in ["First", "Second"]
+        ]
+
+        self.assertEqual(self.client.delete(f"{self.url}{second.id}/").status_code, 204)
+        self.assertEqual(self.get_stats(), (1, first.datetime_created))
+
+        self.assertEqual(self.client.delete(f"{self.url}{first.id}/").status_code, 204)
+        self.assertEqual(self.get_stats(), (0, None))
+
+    def test_deleting_an_older_comment_keeps_the_latest(self):
+        first, second = [
+            Comment.objects.get(pk=self.client.post(self.url, {"body": body}, format="json").json()["id"])
+            for body in ["First", "Second"]
+        ]
+        self.client.delete(f"{self.url}{first.id}/")
+        self.assertEqual(self.get_stats(), (1, second.datetime_created))
+
+
+class CartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title="Category")
+        cls.lamp = Product.objects.create(
+            name="Lamp", category=category, slug="lamp",
+            description="Description", price=10, inventory=100,
+        )
+        cls.bulb = Product.objects.create(
+            name="Bulb", category=category, slug="bulb",
+            description="Description", price="2.50", inventory=100,
+        )
+
+    def setUp(self):
+        self.cart = Cart.objects.create()
+
+    def add(self, product, quantity):
+        return self.client.post(
+            f"/shop/carts/{self.cart.id}/items/", {"product_id": product.id, "quantity": quantity},
+            content_type="application/json",
+        )
+
+    def test_totals(self):
+        self.add(self.lamp, 1)
+        self.add(self.lamp, 2)
+        self.add(self.bulb, 2)
+
+        response = self.client.get(f"/shop/carts/{self.cart.id}/items/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["product"]["id"], item["quantity"], item["total_price"]) for item in response.json()],
+            [(self.lamp.id, 3, "30.00"), (self.bulb.id, 2, "5.00")],
+        )
+        response = self.client.get(f"/shop/carts/{self.cart.id}/")
+        self.assertEqual(response.json()["total_price"], "35.00")
+
+    def test_quantity_is_capped_at_the_column_maximum(self):
+        self.assertEqual(self.add(self.lamp, 32767).status_code, 201)
+        response = self.add(self.lamp, 32767)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["quantity"], 32767)
+
+    def test_items_of_a_missing_cart(self):
+        response = self.client.get(f"/shop/carts/{self.cart.id}/items/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        response = self.client.get(f"/shop/carts/{uuid4()}/items/")
+        self.assertEqual(response.status_code, 404)
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title="Category")
+        self.product = Product.objects.create(
+            name="Product", category=category, slug="product",
+            description="Description", price=10, inventory=1000,
+        )
+        self.cart = Cart.objects.create()
+
+    def test_parallel_adds_of_the_same_product_are_not_lost(self):
+        def add(index):
+            client = APIClient()
+            return [
+                client.post(
+                    f"/shop/carts/{self.cart.id}/items/", {"product_id": self.product.id, "quantity": 1},
+                    format="json",
+                ).status_code
+                for _ in range(10)
+            ]
+
+        results, exceptions, _ = run_concurrently(add, threads=8)
+        self.assertEqual(exceptions, [])
+        self.assertEqual([status for statuses in results for status in statuses], [201] * 80)
+        self.assertEqual(list(CartItem.objects.values_list("quantity", flat=True)), [80])
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="customer@example.com", password="password")
+        category = Category.objects.create(title="Category")
+        self.product = Product.objects.create(
+            name="Product", category=category, slug="product",
+            description="Description", price=10, inventory=30,
+        )
+
+    def create_cart(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        return cart
+
+    def checkout(self, cart):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post("/shop/orders/", {"cart_id": str(cart.id)}, format="json").status_code
+
+    def test_a_cart_is_ordered_once(self):
+        cart = self.create_cart()
+        results, exceptions, _ = run_concurrently(lambda index: self.checkout(cart), threads=self.threads)
+        self.assertEqual(exceptions, [])
+        self.assertEqual(sorted(results), [201] + [400] * (self.threads - 1))
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 29)
+
+    def test_stock_is_not_oversold(self):
+        carts_per_thread = 5
+        carts = [self.create_cart() for _ in range(self.threads * carts_per_thread)]
+
+        def checkout_carts(index):
+            return [self.checkout(cart) for cart in carts[index::self.threads]]
+
+        results, exceptions, seconds = run_concurrently(checkout_carts, threads=self.threads)
+        self.assertEqual(exceptions, [])
+        statuses = sorted(status for statuses in results for status in statuses)
+        # 30 units for 40 carts of one unit each
+        self.assertEqual(statuses, [201] * 30 + [400] * 10)
+        self.assertEqual(Order.objects.count(), 30)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 0)
+        print(f"\n{len(carts) / seconds:.1f} checkouts/s with {self.threads} threads", end=" ")
+
+
+class ProductImportTests(TestCase):
+    header = "sku,name,category,description,price,inventory\n"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="manager@example.com", password="password")
+        cls.user.groups.add(Group.objects.create(name="Product Management"))
+        cls.category = Category.objects.create(title="Lighting")
+        cls.other_category = Category.objects.create(title="Furniture")
+        cls.lamp = Product.objects.create(
+            name="lamp", category=cls.category, slug="lamp", sku="LAMP-1",
+            description="Description", price=10, inventory=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def run_import(self, csv_text):
+        return ProductImporter().run(read_csv_rows(StringIO(self.header + csv_text)))
+
+    def test_rows_are_matched_on_the_sku(self):
+        report = self.run_import(
+            "LAMP-1,Lamp!,Furniture,Updated,12.50,3\n"
+            "LAMP-2,lamp,Lighting,Another lamp,8,5\n"
+            "CHAIR-1,صندلی,Furniture,Chair,40,1\n"
+        )
+        self.assertEqual((report["created"], report["updated"], report["errors"]), (2, 1, []))
+
+        self.lamp.refresh_from_db()
+        self.assertEqual(
+            (self.lamp.name, self.lamp.slug, self.lamp.category_id, self.lamp.description, self.lamp.inventory),
+            ("Lamp!", "lamp", self.other_category.id, "Updated", 3),
+        )
+        self.assertEqual(Product.objects.get(sku="LAMP-2").name, "lamp")
+        # a name that slugifies to nothing falls back to the SKU
+        self.assertEqual(Product.objects.get(sku="CHAIR-1").slug, "chair-1")
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        self.assertEqual((self.category.products_count, self.other_category.products_count), (1, 2))
+
+    def test_the_last_row_of_a_repeated_sku_wins(self):
+        report = self.run_import("LAMP-2,Lamp,Lighting,First,8,5\nLAMP-2,Lamp,Lighting,Second,8,5\n")
+        self.assertEqual((report["created"], report["updated"]), (1, 0))
+        self.assertEqual(Product.objects.get(sku="LAMP-2").description, "Second")
+
+    def test_long_names_are_cut_to_the_slug_length(self):
+        self.run_import(f"LAMP-2,{'Lamp ' * 50},Lighting,Lamp,8,5\n")
+        self.assertEqual(len(Product.objects.get(sku="LAMP-2").slug), 50)
+
+    def test_invalid_rows_are_reported(self):
+        report = self.run_import(
+            ",Lamp,Lighting,No SKU,8,5\n"
+            f"{'X' * 65},Lamp,Lighting,Long SKU,8,5\n"
+            "LAMP-2,Lamp,Garden,Unknown category,8,5\n"
+            "LAMP-3,Lamp,Lighting,Negative inventory,8,-1\n"
+            "LAMP-4,Lamp,Lighting,Valid,8,5\n"
+        )
+        self.assertEqual((report["processed"], report["created"], report["error_count"]), (5, 1, 4))
+        self.assertEqual(
+            [(error["line"], list(error["errors"])) for error in report["errors"]],
+            [(2, ["sku"]), (3, ["sku"]), (4, ["category"]), (5, ["inventory"])],
+        )
+        self.assertEqual(list(Product.objects.order_by("id").values_list("sku", flat=True)), ["LAMP-1", "LAMP-4"])
+
+    def test_import_endpoint(self):
+        client = APIClient()
+        self.assertIn(client.post("/shop/products/import/").status_code, [401, 403])
+
+        client.force_authenticate(self.user)
+        body = self.header + "LAMP-1,Lamp,Lighting,Updated,12.50,3\nLAMP-2,Lamp,Lighting,New,8,5\n"
+        response = client.generic("POST", "/shop/products/import/", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.json()[key] for key in ["processed", "created", "updated", "error_count"]},
+            {"processed": 2, "created": 1, "updated": 1, "error_count": 0},
+        )
+
+        body = json.dumps({"sku": "LAMP-3", "name": "Lamp", "category": "Lighting",
+                           "description": "New", "price": "8", "inventory": 5}) + "\n"
+        response = client.generic("POST", "/shop/products/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.json()["created"], 1)
+
+        response = client.generic("POST", "/shop/products/import/", "<products/>", content_type="application/xml")
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class TransferMemoryTests(TransactionTestCase):
+    # every import batch commits, so its on_commit callbacks do not pile up
+    chunk_size = 100
+
+    def setUp(self):
+        self.category = Category.objects.create(title="Category")
+
+    def seed(self, size):
+        start = Product.objects.count()
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", category=self.category, slug=f"product-{i}", sku=f"SKU-{i}",
+                description="Description " * 20, price=10, inventory=i,
+            )
+            for i in range(start, size)
+        ])
+
+    def peak_memory(self, function):
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def export_peak(self):
+        return self.peak_memory(lambda: sum(map(len, export_csv(iter_product_chunks(self.chunk_size)))))
+
+    def import_peak(self):
+        # allocated before tracing starts, like a file read line by line
+        lines = "".join(export_csv(iter_product_chunks(self.chunk_size))).splitlines(keepends=True)
+        return self.peak_memory(lambda: ProductImporter(batch_size=self.chunk_size).run(read_csv_rows(iter(lines))))
+
+    def test_memory_does_not_grow_with_the_products(self):
+        self.seed(300)
+        export_peak, import_peak = self.export_peak(), self.import_peak()
+        self.seed(3000)
+        # ten times the rows, bounded caches (LocMemCache, sqlite3 statements)
+        # still fill up during the first batches of the import
+        self.assertLess(self.export_peak(), export_peak * 1.5)
+        self.assertLess(self.import_peak(), import_peak * 2)
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 is SQLite specific")
+class SQLiteFullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(title="Lighting")
+        cls.lamp = Product.objects.create(
+            name="Desk Lamp", category=cls.category, slug="desk-lamp",
+            description="A lamp for the desk, the brightest lamp.", price=10, inventory=10,
+        )
+        cls.kettle = Product.objects.create(
+            name="Kettle", category=Category.objects.create(title="Kitchen"), slug="kettle",
+            description="Boils water, no lamp included.", price=10, inventory=10,
+        )
+
+    def search(self, term):
+        cache.clear()
+        response = self.client.get("/shop/products/", {"search": term})
+        return [product["name"] for product in response.json()["results"]]
+
+    def test_matches_terms_and_prefixes(self):
+        self.assertEqual(self.search("kettle"), ["Kettle"])
+        self.assertEqual(self.search("kett"), ["Kettle"])
+        self.assertEqual(self.search("boils kett"), ["Kettle"])
+        self.assertEqual(self.search("toaster"), [])
+
+    def test_orders_by_relevance(self):
+        self.assertEqual(self.search("lamp"), ["Desk Lamp", "Kettle"])
+
+    def test_index_follows_product_writes(self):
+        self.lamp.name = "Floor Light"
+        self.lamp.description = "Stands on the floor."
+        self.lamp.save()
+        self.assertEqual(self.search("desk"), [])
+        self.assertEqual(self.search("floor"), ["Floor Light"])
+
+        self.lamp.delete()
+        self.assertEqual(self.search("floor"), [])
+
+    def test_index_follows_category_renames(self):
+        self.category.title = "Illumination"
+        self.category.save()
+        self.assertEqual(self.search("illumination"), ["Desk Lamp"])
+        self.assertEqual(self.search("lighting"), [])
+
+
+class MySQLFullTextSearchTests(SimpleTestCase):
+    def test_unindexed_tokens_are_not_required(self):
+        backend = MySQLFullTextSearchBackend()
+        self.assertEqual(backend.build_query(["The", "tv", "Lamp"]), "The* tv* +Lamp*")
+
+
+class SeedCommandTests(TestCase):
+    def seed(self, **options):
+        call_command("seed", stdout=StringIO(), batch_size=50, skip_search_index=True, **options)
+
+    def test_zipf_counts_add_up(self):
+        counts = zipf_counts(1000, 50, 1.1)
+        self.assertEqual(sum(counts), 1000)
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(zipf_counts(10, 5, 0), [2] * 5)
+
+    def test_seeds_consistent_data(self):
+        self.seed(categories=3, products=120, users=20, comments=300, carts=10, items_per_cart=2)
+
+        self.assertEqual(Product.objects.count(), 120)
+        self.assertEqual(Product.objects.values("slug").distinct().count(), 120)
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Address.objects.count(), 20)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(CartItem.objects.count(), 20)
+        for category in Category.objects.annotate(actual_count=Count("products")):
+            self.assertEqual(category.products_count, category.actual_count)
+        for product in Product.objects.annotate(actual_count=Count("comments"), latest=Max("comments__datetime_created")):
+            self.assertEqual((product.comment_count, product.last_commented_at), (product.actual_count, product.latest))
+
+    def test_same_seed_generates_the_same_products(self):
+        self.seed(seed=1, products=60, comments=0, carts=0)
+        first = list(Product.objects.order_by("id").values_list("name", "price", "inventory"))
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(seed=1, products=60, comments=0, carts=0)
+        self.assertEqual(list(Product.objects.order_by("id").values_list("name", "price", "inventory")), first)
+
+
+class AsyncCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title="Category")
+        cls.products = Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", category=category, slug=f"product-{i}",
+                description="Description", price=10, inventory=i,
+            )
+            for i in range(150)
+        ])
+
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    async def test_renders_like_the_viewsets(self):
+        product_id = self.products[0].id
+        for sync_url, async_url in [
+            ("/shop/products/", "/shop/async/products/"),
+            ("/shop/products/?page=2", "/shop/async/products/?page=2"),
+            (f"/shop/products/{product_id}/", f"/shop/async/products/{product_id}/"),
+            ("/shop/products/0/", "/shop/async/products/0/"),
+            ("/shop/categories/", "/shop/async/categories/"),
+        ]:
+            expected = await self.async_client.get(sync_url)
+            response = await self.async_client.get(async_url)
+            with self.subTest(url=async_url):
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.json(), self.replace_links(expected.json()))
+
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    async def test_unsupported_params_are_rejected(self):
+        for query, params in [
+            ("search=product", "search"),
+            ("ordering=-inventory", "ordering"),
+            ("cursor=abc", "cursor"),
+            ("pagination=cursor&page=2", "pagination"),
+            ("search=product&ordering=name", "ordering, search"),
+        ]:
+            response = await self.async_client.get(f"/shop/async/products/?{query}")
+            with self.subTest(query=query):
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.json()["detail"].endswith(f": {params}."))
+
+    def replace_links(self, data):
+        if isinstance(data, dict):
+            return {
+                key: value.replace("/shop/", "/shop/async/") if key in ("next", "previous") and value else value
+                for key, value in data.items()
+            }
+        return data
@@ -1,10 +1,35 @@
-from rest_framework import routers
+from django.urls import path
+from rest_framework_nested import routers
 
-from .views import CategoryViewSet, ProductViewSet
+from .views import (
+    CartItemViewSet,
+    CartViewSet,
+    CategoryViewSet,
+    CommentViewSet,
+    OrderViewSet,
+    ProductViewSet,
+    ResponseCacheStatsView,
+    async_category_list,
+    async_product_detail,
+    async_product_list,
+)
 
 router = routers.DefaultRouter()
 
 router.register("categories", CategoryViewSet, basename="category")
 router.register("products", ProductViewSet, basename="product")
+router.register("carts", CartViewSet, basename="cart")
+router.register("orders", OrderViewSet, basename="order")
 
-urlpatterns = router.urls
+carts_router = routers.NestedDefaultRouter(router, "carts", lookup="cart")
+carts_router.register("items", CartItemViewSet, basename="cart-items")
+
+products_router = routers.NestedDefaultRouter(router, "products", lookup="product")
+products_router.register("comments", CommentViewSet, basename="product-comments")
+
+urlpatterns = [
+    path("cache/stats/", ResponseCacheStatsView.as_view(), name="response-cache-stats"),
+    path("async/categories/", async_category_list, name="async-category-list"),
+    path("async/products/", async_product_list, name="async-product-list"),
+    path("async/products/<int:pk>/", async_product_detail, name="async-product-detail"),
+] + router.urls + carts_router.urls + products_router.urls
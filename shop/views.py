@@ -1,22 +1,58 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
 from rest_framework import status
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import get_object_or_404
+from rest_framework.mixins import CreateModelMixin, DestroyModelMixin, RetrieveModelMixin
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
+
+from core.permissions import IsSuperUser
+from core.throttling import UserTokenBucketThrottle
 
-from .models import Category, Product
-from .paginations import DefaultPagination
-from .permissions import IsInGroup
+from . import cache as response_cache
+from .exporters import EXPORTERS, iter_product_chunks
+from .filters import ProductSearchFilter
+from .importers import ROW_READERS, ProductImporter, decode_lines
+from .mixins import ConditionalGetMixin, ResponseCacheMixin
+from .models import Cart, CartItem, Category, Comment, Order, Product
+from .paginations import CommentPagination, DefaultPagination, KeysetPagination
+from .permissions import IsInGroup, IsOwnerObject
 from .serializers import (
+    AddCartItemSerializer,
+    CartItemSerializer,
+    CartSerializer,
     CategorySerializer, 
     CategoryCreateUpdateSerializer,
+    CommentCreateSerializer,
+    CommentSerializer,
+    CreateOrderSerializer,
+    OrderSerializer,
     ProductSerializer,
     ProductCreateUpdateSerializer,
+    UpdateCartItemSerializer,
 )
+from .signals.handlers import remove_comment_stats
 
 
-class CategoryViewSet(ModelViewSet):
-    queryset = Category.objects.prefetch_related("products")
+class CategoryViewSet(ResponseCacheMixin, ConditionalGetMixin, ModelViewSet):
+    queryset = Category.objects.all()
     required_group = "Product Management"
+    list_cache_tag = response_cache.CATEGORY_LIST_TAG
+    list_version_tags = [response_cache.CATEGORY_LIST_TAG, ]
+
+    def get_object_cache_tag(self, pk):
+        return response_cache.category_tag(pk)
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -30,30 +66,291 @@ class CategoryViewSet(ModelViewSet):
     
     def destroy(self, request, *args, **kwargs):
         category = self.get_object()
-        if category.products.count() > 0:
-            return Response(
-                data={"Error": "There is some products relating this category. Please remove them first"},
-                status=status.HTTP_405_METHOD_NOT_ALLOWED,
-            )
-        category.delete()
+        protected = Response(
+            data={"Error": "There is some products relating this category. Please remove them first"},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED,
+        )
+        if category.products_count > 0:
+            return protected
+        try:
+            category.delete()
+        except ProtectedError:
+            # products_count lagged behind a concurrent product create
+            return protected
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ResponseCacheMixin, ConditionalGetMixin, ModelViewSet):
     queryset = Product.objects.select_related("category")
     pagination_class = DefaultPagination
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ['name', ]
-    ordering_fields = ['id', 'inventory', ]
+    filter_backends = [ProductSearchFilter, OrderingFilter]
+    search_fields = ['name', 'description', 'category__title', ]
+    ordering_fields = ['id', 'name', 'inventory', ]
     required_group = "Product Management"
+    list_cache_tag = response_cache.PRODUCT_LIST_TAG
+    # products are rendered with their category title
+    related_cache_tags = [response_cache.CATEGORY_LIST_TAG, ]
+    list_version_tags = [response_cache.PRODUCT_LIST_TAG, response_cache.CATEGORY_LIST_TAG, ]
+    import_content_types = {
+        'text/csv': 'csv',
+        'application/x-ndjson': 'ndjson',
+        'application/jsonl': 'ndjson',
+    }
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_products']:
             return [IsInGroup(), ]
+        if self.action == 'export':
+            return [IsAuthenticated(), ]
         return super().get_permissions()
+
+    def get_throttles(self):
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_products']:
+            return [UserTokenBucketThrottle('product_write'), ]
+        return super().get_throttles()
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return ProductCreateUpdateSerializer
         return ProductSerializer
-    
\ No newline at end of file
+
+    def get_object_cache_tag(self, pk):
+        return response_cache.product_tag(pk)
+
+    def get_object_validators(self, instance):
+        return {
+            'pk': instance.pk,
+            'last_modified': instance.datetime_modified,
+            'category_last_modified': instance.category.datetime_modified,
+        }
+
+    def get_pagination_class(self):
+        query_params = self.request.query_params
+        if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+            return KeysetPagination
+        return self.pagination_class
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.get_pagination_class()()
+        return self._paginator
+
+    @action(detail=False, methods=['POST'], url_path='import')
+    def import_products(self, request, *args, **kwargs):
+        content_type = request.content_type.split(';')[0].strip()
+        row_format = self.import_content_types.get(content_type)
+        if row_format is None:
+            return Response(
+                data={"Error": f"Unsupported content type. Use one of: {', '.join(self.import_content_types)}"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+
+        # read the body as a stream instead of letting a parser load it whole
+        stream = request.stream or []
+        rows = ROW_READERS[row_format](decode_lines(stream))
+        report = ProductImporter().run(rows)
+        return Response(report)
+
+    @action(detail=False, methods=['GET'], url_path=r'export/(?P<export_format>csv|ndjson|json)')
+    def export(self, request, export_format, *args, **kwargs):
+        exporter, content_type = EXPORTERS[export_format]
+        response = StreamingHttpResponse(exporter(iter_product_chunks()), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{export_format}"'
+        return response
+
+
+class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+    queryset = Cart.objects.all()
+    serializer_class = CartSerializer
+    lookup_value_regex = '[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}'
+
+    def get_cart(self):
+        # items, line totals and the cart total all come from one joined query;
+        # only an empty cart needs a second lookup to tell it from a missing one
+        items = list(CartItem.objects.with_totals().filter(cart_id=self.kwargs['pk']).order_by('id'))
+        if items:
+            cart = items[0].cart
+            cart.total_price = items[0].cart_total_price
+        else:
+            cart = self.get_object()
+            cart.total_price = Decimal(0)
+        cart.line_items = items
+        return cart
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_cart())
+        return Response(serializer.data)
+
+    def perform_create(self, serializer):
+        cart = serializer.save()
+        cart.line_items = []
+        cart.total_price = Decimal(0)
+
+
+class CartItemViewSet(ModelViewSet):
+    http_method_names = ['get', 'post', 'patch', 'delete', ]
+
+    def get_queryset(self):
+        return CartItem.objects.with_totals().filter(cart_id=self.kwargs['cart_pk']).order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        items = list(self.get_queryset())
+        if not items:
+            # an empty list must still tell an empty cart from a missing one
+            get_object_or_404(Cart, pk=self.kwargs['cart_pk'])
+        serializer = self.get_serializer(items, many=True)
+        return Response(serializer.data)
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return AddCartItemSerializer
+        if self.action == 'partial_update':
+            return UpdateCartItemSerializer
+        return CartItemSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['cart_pk'] = self.kwargs['cart_pk']
+        return context
+
+
+class CommentViewSet(ModelViewSet):
+    http_method_names = ['get', 'post', 'patch', 'delete', ]
+    pagination_class = CommentPagination
+    ordering_fields = ['datetime_created', ]
+
+    def get_queryset(self):
+        return Comment.objects.select_related('user').filter(product_id=self.kwargs['product_pk'])
+
+    def get_permissions(self):
+        if self.action == 'create':
+            return [IsAuthenticated(), ]
+        if self.action in ['partial_update', 'destroy']:
+            return [IsAuthenticated(), IsOwnerObject(), ]
+        return super().get_permissions()
+
+    def get_serializer_class(self):
+        if self.action in ['create', 'partial_update']:
+            return CommentCreateSerializer
+        return CommentSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['product_pk'] = self.kwargs['product_pk']
+        return context
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        comment = serializer.save()
+        comment = self.get_queryset().get(pk=comment.pk)
+        return Response(CommentSerializer(comment).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            remove_comment_stats(instance)
+
+
+class OrderViewSet(ModelViewSet):
+    http_method_names = ['get', 'post', ]
+    permission_classes = [IsAuthenticated, ]
+
+    def get_queryset(self):
+        return (
+            Order.objects
+            .filter(user_id=self.request.user.id)
+            .prefetch_related('items__product')
+            .order_by('-id')
+        )
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return CreateOrderSerializer
+        return OrderSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+        order = self.get_queryset().get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = (IsSuperUser, )
+
+    def get(self, request):
+        return Response(response_cache.get_stats())
+
+
+# Native async read path for the catalog. The views render the same JSON as
+# the list and retrieve actions of the viewsets, without search, ordering,
+# cursor pagination, conditional GET or the response cache, and only hold a
+# thread while the ORM runs a query. Requests asking for what they do not
+# support are rejected rather than answered with a different list.
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def get_unsupported_product_params(request):
+    params = {api_settings.SEARCH_PARAM, api_settings.ORDERING_PARAM, KeysetPagination.cursor_query_param}
+    unsupported = sorted(params & set(request.GET))
+    if request.GET.get('pagination') == 'cursor':
+        unsupported.append('pagination')
+    return unsupported
+
+
+@require_safe
+async def async_product_list(request):
+    unsupported = get_unsupported_product_params(request)
+    if unsupported:
+        return json_response(
+            {'detail': f"Not supported by the async views, use /shop/products/: {', '.join(unsupported)}."},
+            status=400,
+        )
+
+    page_size = DefaultPagination.page_size
+    try:
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        return json_response({'detail': "Invalid page."}, status=404)
+
+    queryset = Product.objects.select_related('category').order_by('id')
+    count = await queryset.acount()
+    offset = (page - 1) * page_size
+    if page > 1 and offset >= count:
+        return json_response({'detail': "Invalid page."}, status=404)
+    products = [product async for product in queryset[offset:offset + page_size].aiterator()]
+
+    url = request.build_absolute_uri()
+    previous_url = None
+    if page == 2:
+        previous_url = remove_query_param(url, 'page')
+    elif page > 2:
+        previous_url = replace_query_param(url, 'page', page - 1)
+    return json_response({
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if offset + page_size < count else None,
+        'previous': previous_url,
+        'results': ProductSerializer(products, many=True).data,
+    })
+
+
+@require_safe
+async def async_product_detail(request, pk):
+    try:
+        product = await Product.objects.select_related('category').aget(pk=pk)
+    except Product.DoesNotExist:
+        return json_response({'detail': "No Product matches the given query."}, status=404)
+    return json_response(ProductSerializer(product).data)
+
+
+@require_safe
+async def async_category_list(request):
+    categories = [category async for category in Category.objects.order_by('id').aiterator()]
+    return json_response(CategorySerializer(categories, many=True).data)